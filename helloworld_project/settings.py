@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -40,6 +44,7 @@ INSTALLED_APPS = [
     # ─── Our Tutorial Apps ───────────────────────────────
     'pages',      # Home & About pages
     'products',   # Products module
+    'profiling',  # On-demand request profiler
 ]
 
 MIDDLEWARE = [
@@ -48,6 +53,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Profiles a request only when asked to (needs request.user)
+    'profiling.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,6 +78,38 @@ TEMPLATES = [
     },
 ]
 
+# Optional compiled-template backend for the hottest storefront pages.
+# Views render them with STOREFRONT_TEMPLATE_ENGINE (see products/views.py):
+#   'django' (default) → DjangoTemplates
+#   'jinja2'           → Jinja2 (pip install jinja2)
+# The choice is explicit: installing jinja2 (e.g. as another package's
+# dependency) must not switch the storefront by itself.
+STOREFRONT_TEMPLATE_ENGINE = os.environ.get('STOREFRONT_TEMPLATE_ENGINE', 'django')
+JINJA2_BYTECODE_CACHE_DIR = BASE_DIR / '.jinja2_cache'
+JINJA2_INSTALLED = find_spec('jinja2') is not None
+
+if STOREFRONT_TEMPLATE_ENGINE not in ('django', 'jinja2'):
+    raise ImproperlyConfigured(
+        f"STOREFRONT_TEMPLATE_ENGINE must be 'django' or 'jinja2', not {STOREFRONT_TEMPLATE_ENGINE!r}."
+    )
+if STOREFRONT_TEMPLATE_ENGINE == 'jinja2' and not JINJA2_INSTALLED:
+    raise ImproperlyConfigured(
+        "STOREFRONT_TEMPLATE_ENGINE='jinja2' but Jinja2 is not installed (pip install jinja2)."
+    )
+
+# Registered whenever installed so bench_templates can compare both engines
+if JINJA2_INSTALLED:
+    TEMPLATES.append({
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'NAME': 'jinja2',
+        'DIRS': [BASE_DIR / 'jinja2'],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'environment': 'helloworld_project.jinja2.environment',
+            'auto_reload': DEBUG,
+        },
+    })
+
 WSGI_APPLICATION = 'helloworld_project.wsgi.application'
 
 
@@ -84,6 +123,44 @@ DATABASES = {
     }
 }
 
+# Horizontal sharding of products/comments (see products/sharding.py)
+# PRODUCT_SHARD_COUNT=0 keeps everything in db.sqlite3. With N > 0 each
+# shard is its own SQLite file: db_shard_0.sqlite3, db_shard_1.sqlite3...
+#   PRODUCT_SHARD_COUNT=2 python manage.py migrate
+#   PRODUCT_SHARD_COUNT=2 python manage.py migrate --database=shard_0
+#   PRODUCT_SHARD_COUNT=2 python manage.py migrate --database=shard_1
+# Products/comments created before sharding stay in db.sqlite3 (invisible to
+# the shards) until they are moved with:
+#   PRODUCT_SHARD_COUNT=2 python manage.py shard_default_data
+# Tests: helloworld_project/settings_test.py adds two shard databases so the
+# test suite runs both with and without sharding.
+PRODUCT_SHARD_COUNT = int(os.environ.get('PRODUCT_SHARD_COUNT', '0'))
+PRODUCT_SHARDS = [f'shard_{i}' for i in range(PRODUCT_SHARD_COUNT)]
+
+for _alias in PRODUCT_SHARDS:
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{_alias}.sqlite3',
+    }
+
+DATABASE_ROUTERS = ['products.routers.ProductShardRouter']
+
+# Virtual buckets (product.id % N); ranges of buckets are moved by rebalance_shards
+PRODUCT_SHARD_BUCKETS = 64
+# Seconds a process caches the bucket → shard map
+PRODUCT_SHARD_MAP_TTL = 5
+# Ids reserved per round-trip to the central sequence table
+PRODUCT_SHARD_ID_BLOCK = 100
+
+# "Frequently bought together" (products/recommendations.py).
+# True: each add-to-cart bumps the pair counts immediately.
+# False: only log CartEvents; run `manage.py rebuild_related` periodically.
+RELATED_PRODUCTS_INCREMENTAL = True
+
+# Change feed /products/changes/ (products/changes.py): staff sessions or a
+# signed X-Changes-Token header (python manage.py changes_token --consumer <name>)
+CHANGES_TOKEN_MAX_AGE = 30 * 24 * 3600  # seconds a consumer token stays valid
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -124,5 +201,12 @@ STATIC_URL = '/static/'
 # Project-level static files directory
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+# On-demand request profiling (see profiling/middleware.py)
+PROFILING_ENABLED = True
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_KEEP = 50
+PROFILING_SAMPLE_INTERVAL = 0.001  # seconds between stack samples
+PROFILING_TOKEN_MAX_AGE = 3600     # seconds a signed X-Profile token stays valid
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,24 @@
+"""
+Settings for the test suite:
+
+    python manage.py test --settings=helloworld_project.settings_test
+
+Same as settings.py (PRODUCT_SHARDS keeps its production value, [] by
+default), plus two shard databases. Test classes that need sharding turn
+it on with override_settings(PRODUCT_SHARDS=['shard_0', 'shard_1']), so
+one run covers both layouts. Under plain settings those classes are
+skipped.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+TEST_SHARDS = ['shard_0', 'shard_1']
+
+# A copy: settings.DATABASES itself must stay untouched
+DATABASES = dict(DATABASES)
+for _alias in TEST_SHARDS:
+    DATABASES.setdefault(_alias, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{_alias}.sqlite3',
+    })
@@ -21,4 +21,7 @@ urlpatterns = [
 
     # ── Products app  →  handles:  /products/  and  /products/<id>/
     path('products/', include('products.urls')),
+
+    # ── Profiling app  →  handles:  /profiling/  (staff only)
+    path('profiling/', include('profiling.urls')),
 ]
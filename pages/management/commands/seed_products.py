@@ -5,27 +5,50 @@ COMANDO DE GESTIÓN (SEEDER)
 ─────────────────────────────────────────
 Comando personalizado para poblar la BBDD.
 Se ejecuta con: python manage.py seed_products
+
+Los productos se insertan con bulk_create_unique, que descarta los
+casi duplicados (Faker repite frases a menudo).
 """
 
 from django.core.management.base import BaseCommand
 from products.factories import ProductFactory, CommentFactory
 
+PRODUCTS = 8
+COMMENTS_PER_PRODUCT = 2
+
+# Rondas de build_batch para reponer los productos descartados
+MAX_ROUNDS = 5
+
 class Command(BaseCommand):
     help = 'Crea productos y comentarios de prueba automáticamente'
 
     def handle(self, *args, **kwargs):
         self.stdout.write(self.style.WARNING('Eliminando datos anteriores...'))
         # Limpiamos antes de generar (opcional, pero útil)
-        from products.models import Product
-        Product.objects.all().delete()
+        from products.models import Comment, Product
+        Product.objects.delete_everywhere()
 
         self.stdout.write(self.style.SUCCESS('Generando productos con Factory Boy / Faker...'))
-        
-        # create_batch(8) crea 8 productos y los guarda en base de datos
-        products = ProductFactory.create_batch(8)
+
+        # build_batch crea los objetos en memoria; bulk_create_unique los guarda
+        products, skipped = [], 0
+        for _ in range(MAX_ROUNDS):
+            if len(products) >= PRODUCTS:
+                break
+            created, duplicates = Product.objects.bulk_create_unique(
+                ProductFactory.build_batch(PRODUCTS - len(products))
+            )
+            products += created
+            skipped += len(duplicates)
 
         # Generar un par de comentarios para cada producto
-        for product in products:
-            CommentFactory.create_batch(2, product=product)
+        Comment.objects.bulk_create([
+            comment
+            for product in products
+            for comment in CommentFactory.build_batch(COMMENTS_PER_PRODUCT, product=product)
+        ])
 
-        self.stdout.write(self.style.SUCCESS('¡Éxito! Se crearon 8 productos y sus comentarios.'))
+        self.stdout.write(self.style.SUCCESS(
+            f'¡Éxito! Se crearon {len(products)} productos y sus comentarios '
+            f'({skipped} casi duplicados descartados).'
+        ))
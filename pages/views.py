@@ -10,9 +10,12 @@ MVC Role: VIEW (in Django this is the Controller logic layer)
 ─────────────────────────────────────────────────────────────────
 """
 
+import uuid
+
 from django.views.generic import TemplateView
 from django.views import View
 from django.shortcuts import render, redirect
+from products import recommendations
 from products.models import Product
 
 
@@ -61,7 +64,7 @@ class CartView(View):
     
     def get(self, request):
         # Database products
-        db_products = Product.objects.all()
+        db_products, _ = Product.objects.across_shards()
         products = {str(p.id): p for p in db_products}
 
         # Get cart products from session
@@ -85,6 +88,10 @@ class CartView(View):
     def post(self, request, product_id):
         # Get cart products from session and add the new product
         cart_product_data = request.session.get('cart_product_data', {})
+        if product_id.isdigit() and product_id not in cart_product_data:
+            # Feed the "frequently bought together" pair counts
+            cart_id = request.session.setdefault('cart_id', uuid.uuid4().hex)
+            recommendations.record_cart_add(cart_id, int(product_id), cart_product_data)
         cart_product_data[product_id] = product_id
         request.session['cart_product_data'] = cart_product_data
 
@@ -96,5 +103,7 @@ class CartRemoveAllView(View):
         # Remove all products from cart in session
         if 'cart_product_data' in request.session:
             del request.session['cart_product_data']
+        # The next product starts a new cart (its CartEvents are kept)
+        request.session.pop('cart_id', None)
 
         return redirect('pages:cart_index')
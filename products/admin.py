@@ -1,12 +1,145 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import ValidationError
+
+from . import sharding
 from .models import Product, Comment
 
+
+# Con sharding cada listado del admin muestra UN shard (filtro "shard",
+# por defecto el primero) y los objetos se buscan en su shard por id.
+
+class ShardListFilter(admin.SimpleListFilter):
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in sharding.shard_aliases()]
+
+    def queryset(self, request, queryset):
+        # ShardedModelAdmin.get_queryset ya ha elegido la BBDD
+        return queryset
+
+    def choices(self, changelist):
+        current = self.value() or sharding.shard_aliases()[0]
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': current == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+
+    def get_list_filter(self, request):
+        list_filter = list(super().get_list_filter(request))
+        return [ShardListFilter, *list_filter] if sharding.is_enabled() else list_filter
+
+    def selected_shard(self, request):
+        aliases = sharding.shard_aliases()
+        alias = request.GET.get(ShardListFilter.parameter_name)
+        return alias if alias in aliases else aliases[0]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(self.selected_shard(request))
+
+    def shard_for_add(self, request):
+        """Shard del alta (Product.save() lo recalcula con el id nuevo)."""
+        return sharding.shard_aliases()[0]
+
+    def shard_of(self, request, object_id):
+        obj = self.get_object(request, unquote(object_id))
+        return obj._state.db if obj is not None else self.selected_shard(request)
+
+    # El admin abre transacciones y recoge borrados en cascada con
+    # router.db_for_write(model), sin instancia: se fija el shard de la vista.
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        if object_id is None:
+            alias = self.shard_for_add(request)
+        else:
+            alias = self.shard_of(request, object_id)
+        with sharding.pinned(alias):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with sharding.pinned(self.shard_of(request, object_id)):
+            return super().delete_view(request, object_id, extra_context)
+
+    def changelist_view(self, request, extra_context=None):
+        with sharding.pinned(self.selected_shard(request)):
+            return super().changelist_view(request, extra_context)
+
+    def shards_for(self, pk):
+        """Shards donde puede estar el objeto `pk`."""
+        return sharding.shard_aliases()
+
+    def get_object(self, request, object_id, from_field=None):
+        queryset = super().get_queryset(request)
+        try:
+            pk = queryset.model._meta.pk.to_python(object_id)
+        except ValidationError:
+            return None
+        for alias in self.shards_for(pk):
+            obj = queryset.using(alias).filter(pk=pk).first()
+            if obj is not None:
+                return obj
+        return None
+
+
+class ProductIdField(forms.IntegerField):
+    """Producto por id, buscado en su shard (un <select> leería sólo uno)."""
+
+    def clean(self, value):
+        pk = super().clean(value)
+        if pk is None:
+            return None
+        product = Product.objects.for_id(pk).filter(pk=pk).first()
+        if product is None:
+            raise ValidationError('No existe el producto #%(id)s.', params={'id': pk})
+        return product
+
+
+class CommentAdminForm(forms.ModelForm):
+
+    def clean_product(self):
+        """Un comentario existente no puede pasar a un producto de otro shard."""
+        product = self.cleaned_data['product']
+        current = self.instance._state.db
+        if self.instance.pk is not None and sharding.is_enabled() and product is not None:
+            alias = sharding.alias_for(product.pk)
+            if alias != current:
+                raise ValidationError(
+                    'El producto #%(id)s está en %(alias)s y el comentario en %(current)s; '
+                    'un comentario no puede cambiar de shard.',
+                    params={'id': product.pk, 'alias': alias, 'current': current},
+                )
+        return product
+
+
 # Registramos los modelos para que aparezcan en el panel de administración
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ShardedModelAdmin):
     list_display = ('id', 'name', 'price', 'created_at')
     search_fields = ('name',)
 
+    def shards_for(self, pk):
+        return [sharding.alias_for(pk)]
+
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ShardedModelAdmin):
+    form = CommentAdminForm
     list_display = ('id', 'product', 'created_at')
+
+    def shard_for_add(self, request):
+        product_id = request.POST.get('product', '')
+        if product_id.isdigit():
+            return sharding.alias_for(int(product_id))
+        return super().shard_for_add(request)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product':
+            return ProductIdField(label='Producto (id)')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -0,0 +1,222 @@
+"""
+products/changes.py
+===================
+CHANGE-DATA-CAPTURE — Outbox transaccional de Product y Comment
+─────────────────────────────────────────────────────────────────
+Cada INSERT / UPDATE / DELETE de Product o Comment escribe una fila
+en ChangeEvent DENTRO DE LA MISMA TRANSACCIÓN. Si la transacción
+hace rollback, el evento desaparece con ella: el log nunca miente.
+
+Quién escribe en el outbox:
+  - Product.save() / Comment.save()      (incluye ProductForm.save())
+  - QuerySet.update() / bulk_update()    (ChangeLogQuerySet)
+  - QuerySet.bulk_create()               (ChangeLogQuerySet)
+  - delete() y borrados en cascada       (señal post_delete)
+
+Con sharding cada shard tiene su propio outbox (misma BBDD = misma
+transacción), así que la posición de lectura es un token con un
+número de secuencia por shard: "12" sin sharding, "12.7" con dos.
+
+Consumidores:
+  GET /products/changes/?since=<token>&limit=500   (feed JSON)
+      sólo staff o con cabecera X-Changes-Token firmada:
+      python manage.py changes_token --consumer search
+  python manage.py tail_changes --consumer search   (checkpoint propio)
+  python manage.py compact_changes --days 7         (limpieza)
+─────────────────────────────────────────────────────────────────
+"""
+
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import serializers, signing
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import sharding
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+_state = threading.local()
+
+
+# ── Escritura ────────────────────────────────────────────────────
+
+@contextmanager
+def suppressed():
+    """
+    Desactiva el outbox en el hilo actual. Lo usan operaciones que
+    mueven filas sin cambiarlas (p. ej. rebalance_shards).
+    """
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def is_suppressed():
+    return getattr(_state, 'suppressed', False)
+
+
+def payload_for(instance):
+    """Campos del objeto en formato serializable (como dumpdata)."""
+    data = serializers.serialize('python', [instance])[0]
+    return {'id': instance.pk, **data['fields']}
+
+
+def record(instances, operation, using):
+    """Añade un evento por instancia al outbox del alias `using`."""
+    if is_suppressed():
+        return
+    from .models import ChangeEvent
+
+    events = [
+        ChangeEvent(
+            model=instance._meta.label_lower,
+            object_id=instance.pk,
+            operation=operation,
+            payload={'id': instance.pk} if operation == DELETE else payload_for(instance),
+        )
+        for instance in instances
+    ]
+    if events:
+        ChangeEvent.objects.using(using).bulk_create(events)
+
+
+def save_and_record(instance, save, *args, **kwargs):
+    """Ejecuta `save` y escribe su evento en una única transacción."""
+    operation = CREATE if instance._state.adding else UPDATE
+    using = kwargs.get('using') or router.db_for_write(type(instance), instance=instance)
+    with transaction.atomic(using=using):
+        save(*args, **kwargs)
+        record([instance], operation, using=instance._state.db)
+
+
+@receiver(post_delete, sender='products.Product', dispatch_uid='products_product_changes')
+@receiver(post_delete, sender='products.Comment', dispatch_uid='products_comment_changes')
+def record_delete(sender, instance, using, **kwargs):
+    # post_delete se emite dentro de la transacción del Collector
+    record([instance], DELETE, using=using)
+
+
+# ── Lectura (feed) ───────────────────────────────────────────────
+
+def parse_token(token):
+    """'12.7' → {'shard_0': 12, 'shard_1': 7}. Valores ausentes = 0."""
+    aliases = sharding.shard_aliases()
+    parts = str(token).split('.') if token else []
+    positions = {}
+    for index, alias in enumerate(aliases):
+        try:
+            positions[alias] = max(int(parts[index]), 0)
+        except (IndexError, ValueError):
+            positions[alias] = 0
+    return positions
+
+
+def format_token(positions):
+    return '.'.join(str(positions[alias]) for alias in sharding.shard_aliases())
+
+
+def read_changes(since=None, limit=500):
+    """
+    Devuelve (eventos, next_token) con como mucho `limit` eventos
+    posteriores a `since`, ordenados por fecha entre shards.
+
+    Cada shard se lee por su índice de secuencia (seq > n LIMIT k);
+    al truncar la mezcla cada shard conserva un prefijo de su orden,
+    por lo que el token siguiente nunca se salta eventos.
+    """
+    from .models import ChangeEvent
+
+    positions = parse_token(since)
+    streams = []
+    for alias, seq in positions.items():
+        batch = ChangeEvent.objects.using(alias).filter(seq__gt=seq).order_by('seq')[:limit]
+        streams.append([(alias, event) for event in batch])
+
+    merged = heapq.merge(*streams, key=lambda item: (item[1].created_at, item[1].seq))
+    selected = list(itertools.islice(merged, limit))
+
+    for alias, event in selected:
+        positions[alias] = event.seq
+    return [event for _, event in selected], format_token(positions)
+
+
+def as_dict(event):
+    return {
+        'seq': event.seq,
+        'model': event.model,
+        'object_id': event.object_id,
+        'operation': event.operation,
+        'payload': event.payload,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+# ── Acceso al feed ───────────────────────────────────────────────
+
+TOKEN_HEADER = 'HTTP_X_CHANGES_TOKEN'
+TOKEN_SALT = 'products.changes.consumer'
+
+
+def make_consumer_token(consumer):
+    """Token firmado (con fecha) que identifica al consumidor `consumer`."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(consumer)
+
+
+def read_consumer_token(token):
+    """Nombre del consumidor, o None si la firma no es válida o caducó."""
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.CHANGES_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+# ── Checkpoints por consumidor ───────────────────────────────────
+
+def get_checkpoint(consumer):
+    from .models import ChangeConsumer
+
+    row = ChangeConsumer.objects.using(DEFAULT_DB_ALIAS).filter(name=consumer).first()
+    return row.position if row else ''
+
+
+def save_checkpoint(consumer, token):
+    from .models import ChangeConsumer
+
+    ChangeConsumer.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        name=consumer, defaults={'position': token},
+    )
+
+
+# ── Compactación ─────────────────────────────────────────────────
+
+def compact(older_than_days=7):
+    """
+    Borra eventos más antiguos que `older_than_days` que TODOS los
+    consumidores registrados ya han leído. Devuelve {alias: borrados}.
+    """
+    from .models import ChangeConsumer, ChangeEvent
+
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    consumers = ChangeConsumer.objects.using(DEFAULT_DB_ALIAS).values_list('position', flat=True)
+    checkpoints = [parse_token(position) for position in consumers]
+
+    deleted = {}
+    for alias in sharding.shard_aliases():
+        events = ChangeEvent.objects.using(alias).filter(created_at__lt=cutoff)
+        if checkpoints:
+            events = events.filter(seq__lte=min(cp[alias] for cp in checkpoints))
+        deleted[alias], _ = events.delete()
+    return deleted
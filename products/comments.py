@@ -0,0 +1,102 @@
+"""
+products/comments.py
+====================
+CONTADOR DESNORMALIZADO DE COMENTARIOS
+─────────────────────────────────────────────────────────────────
+Product.comment_count guarda cuántos comentarios tiene el producto,
+para que la página de detalle no haga COUNT(*) en cada visita.
+
+  Comment.save() (nuevo)          → post_save   → +1
+  Comment.save() (otro producto)  → post_save   → -1 / +1
+  comment.delete()                → post_delete → -1
+  Comment.objects...delete()      → CommentQuerySet → -n por producto
+  Comment.objects...update(product=…) → CommentQuerySet → -1 / +1
+  Comment.objects.bulk_create     → CommentQuerySet → +n por producto
+
+Las señales se emiten dentro de la transacción del save/delete, y el
+comentario vive en el shard de su producto, así que el contador se
+actualiza de forma atómica con la fila. Se usa _base_manager para no
+generar eventos UPDATE en el outbox: los consumidores ya reciben los
+eventos de Comment.
+
+Dentro de changes.suppressed() (p. ej. rebalance_shards) no se toca
+el contador; recount() lo recalcula a partir de las filas. Para
+corregir derivas (SQL a mano, borrados fuera del ORM):
+
+  python manage.py recount_comments --dry-run
+  python manage.py recount_comments
+─────────────────────────────────────────────────────────────────
+"""
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changes
+
+
+def adjust_counts(counts, using):
+    """Suma counts[product_id] al contador de cada producto en `using`."""
+    from .models import Product
+
+    for product_id, delta in counts.items():
+        Product._base_manager.using(using).filter(pk=product_id).update(
+            comment_count=F('comment_count') + delta,
+        )
+
+
+def actual_count():
+    """Expresión con el número real de comentarios del producto (0 si no tiene)."""
+    from .models import Comment
+
+    per_product = (
+        Comment.objects.filter(product=OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(per_product), Value(0))
+
+
+def recount(products):
+    """Recalcula comment_count de los productos del QuerySet (un UPDATE)."""
+    return products.model._base_manager.using(products.db).filter(
+        pk__in=products.values('pk'),
+    ).update(comment_count=actual_count())
+
+
+def drifted(products):
+    """Productos del QuerySet cuyo comment_count no coincide con sus filas."""
+    return products.annotate(actual=actual_count()).exclude(comment_count=F('actual'))
+
+
+@receiver(post_save, sender='products.Comment', dispatch_uid='products_comment_count_add')
+def count_on_save(sender, instance, created, using, update_fields=None, **kwargs):
+    if update_fields is not None and not {'product', 'product_id'} & set(update_fields):
+        return
+    previous = getattr(instance, '_saved_product_id', None)
+    instance._saved_product_id = instance.product_id
+    if changes.is_suppressed():
+        return
+    if created:
+        adjust_counts({instance.product_id: 1}, using)
+    elif previous is not None and previous != instance.product_id:
+        # comment.product = otro; comment.save()
+        adjust_counts({previous: -1, instance.product_id: 1}, using)
+
+
+@receiver(post_delete, sender='products.Comment', dispatch_uid='products_comment_count_remove')
+def count_on_delete(sender, instance, using, origin=None, **kwargs):
+    if changes.is_suppressed():
+        return
+    # CommentQuerySet.delete() descuenta por producto en un solo UPDATE
+    if getattr(origin, 'batches_comment_counts', False):
+        return
+    # Borrado en cascada desde el producto (instancia o QuerySet): el
+    # contador desaparece con él, no hace falta un UPDATE por comentario
+    origin_model = getattr(origin, 'model', type(origin))
+    if getattr(origin_model, '_meta', None) and origin_model._meta.label_lower == 'products.product':
+        return
+    adjust_counts({instance.product_id: -1}, using)
@@ -0,0 +1,318 @@
+"""
+products/dedup.py
+=================
+DETECCIÓN DE PRODUCTOS CASI DUPLICADOS — MinHash + LSH
+─────────────────────────────────────────────────────────────────
+Comparar un producto nuevo con TODO el catálogo es O(n). En su lugar
+guardamos en tablas auxiliares (en la BBDD 'default'):
+
+  ProductSignature — hash del texto normalizado + firma MinHash
+  ProductBand      — la firma partida en BANDS bandas (índice LSH)
+
+Para un producto nuevo:
+  1. Normalizamos name + description (minúsculas, sin tildes ni signos).
+  2. Hash exacto → mismo texto normalizado = duplicado seguro.
+  3. MinHash (one permutation hashing) sobre 4-gramas de caracteres
+     → BANDS consultas indexadas
+     (band, bucket) devuelven unos pocos candidatos.
+  4. Estimamos la similitud de Jaccard con cada candidato y nos
+     quedamos con los que superan DUPLICATE_THRESHOLD.
+
+Con BANDS=16 × ROWS=4, dos textos con Jaccard 0.8 coinciden en al
+menos una banda con probabilidad ≈ 0.9998.
+
+El índice se mantiene con señales (save/delete) y en bulk_create/update,
+siempre tras el COMMIT del shard; se puede reconstruir con:
+python manage.py cluster_duplicates --rebuild
+─────────────────────────────────────────────────────────────────
+"""
+
+import hashlib
+import itertools
+import re
+import unicodedata
+import zlib
+from array import array
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changes
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+DUPLICATE_THRESHOLD = 0.8
+
+# Ids por consulta al cargar firmas durante el clustering
+SIGNATURE_BATCH = 500
+
+# Semilla del segundo crc32: da el valor dentro de cada bin
+_VALUE_SEED = 0x9E3779B9
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+# ── Firma de un texto ────────────────────────────────────────────
+
+def normalize(text):
+    """'¡Teclado  Mecánico!' → 'teclado mecanico'"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def product_text(name, description):
+    return normalize(f'{name or ""} {description or ""}')
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def shingles(text):
+    data = text.encode()
+    if len(data) <= SHINGLE_SIZE:
+        return {data}
+    return {data[i:i + SHINGLE_SIZE] for i in range(len(data) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """
+    Firma de NUM_PERM enteros de 32 bits con "one permutation hashing":
+    cada shingle se hashea UNA vez, cae en un bin (crc32 % NUM_PERM) y el
+    bin guarda el mínimo. Los bins vacíos copian el siguiente bin lleno
+    (densificación por rotación). Coste O(shingles) en vez de
+    O(shingles × NUM_PERM) del MinHash clásico.
+    """
+    bins = [None] * NUM_PERM
+    for shingle in shingles(text):
+        slot = zlib.crc32(shingle) % NUM_PERM
+        value = zlib.crc32(shingle, _VALUE_SEED)
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+
+    filled = [i for i, value in enumerate(bins) if value is not None]
+    for i in range(NUM_PERM):
+        if bins[i] is None:
+            # Siguiente bin lleno (circular); el offset evita colisiones artificiales
+            donor = next((j for j in filled if j > i), filled[0])
+            bins[i] = (bins[donor] + (donor - i) % NUM_PERM) & 0xFFFFFFFF
+    return array('I', bins)
+
+
+def band_buckets(signature):
+    """Una clave de 63 bits por banda (cabe en BigIntegerField)."""
+    buckets = []
+    for band in range(BANDS):
+        chunk = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(chunk, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+def similarity(sig_a, sig_b):
+    """Estimación de Jaccard: fracción de posiciones iguales."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def to_bytes(signature):
+    return signature.tobytes()
+
+
+def from_bytes(raw):
+    signature = array('I')
+    signature.frombytes(bytes(raw))
+    return signature
+
+
+# ── Consulta ─────────────────────────────────────────────────────
+
+def exact_duplicate(name, description='', exclude_id=None):
+    """Id de un producto con el mismo texto normalizado, o None."""
+    from .models import ProductSignature
+
+    exact = ProductSignature.objects.using(DEFAULT_DB_ALIAS).filter(
+        content_hash=content_hash(product_text(name, description)),
+    )
+    return exact.exclude(product_id=exclude_id).values_list('product_id', flat=True).first()
+
+
+def find_duplicates(name, description='', exclude_id=None, threshold=DUPLICATE_THRESHOLD):
+    """
+    Devuelve [(product_id, similitud), ...] de mayor a menor similitud.
+    Coste: 1 consulta por hash + 1 por bandas + 1 por firmas candidatas.
+    """
+    from .models import ProductBand, ProductSignature
+
+    if exact_id := exact_duplicate(name, description, exclude_id):
+        return [(exact_id, 1.0)]
+
+    text = product_text(name, description)
+    signatures = ProductSignature.objects.using(DEFAULT_DB_ALIAS)
+    signature = minhash(text)
+    lookup = ProductBand.objects.using(DEFAULT_DB_ALIAS).none()
+    for band, bucket in enumerate(band_buckets(signature)):
+        lookup |= ProductBand.objects.using(DEFAULT_DB_ALIAS).filter(band=band, bucket=bucket)
+    candidate_ids = set(lookup.values_list('product_id', flat=True)) - {exclude_id}
+
+    matches = []
+    for product_id, raw in signatures.filter(product_id__in=candidate_ids).values_list('product_id', 'minhash'):
+        score = similarity(signature, from_bytes(raw))
+        if score >= threshold:
+            matches.append((product_id, score))
+    return sorted(matches, key=lambda match: -match[1])
+
+
+# ── Mantenimiento del índice ─────────────────────────────────────
+
+def index_products(products, replace=True):
+    """
+    (Re)indexa productos. Con replace=True es idempotente: borra antes
+    sus entradas previas en la misma transacción (replace=False sólo
+    para productos que seguro no están en el índice).
+    """
+    from .models import ProductBand, ProductSignature
+
+    products = [product for product in products if product.pk is not None]
+    if not products:
+        return
+
+    rows, bands = [], []
+    for product in products:
+        text = product_text(product.name, product.description)
+        signature = minhash(text)
+        rows.append((product.pk, content_hash(text), to_bytes(signature)))
+        bands.extend(
+            (product.pk, band, bucket)
+            for band, bucket in enumerate(band_buckets(signature))
+        )
+
+    # executemany directo: el ORM (bulk_create) multiplica por ~4 el coste
+    # con BANDS filas por producto
+    signature_table = ProductSignature._meta.db_table
+    band_table = ProductBand._meta.db_table
+    ids = [product.pk for product in products]
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if replace:
+            ProductBand.objects.using(DEFAULT_DB_ALIAS).filter(product_id__in=ids).delete()
+            ProductSignature.objects.using(DEFAULT_DB_ALIAS).filter(product_id__in=ids).delete()
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {signature_table} (product_id, content_hash, minhash) VALUES (%s, %s, %s)',
+                rows,
+            )
+            cursor.executemany(
+                f'INSERT INTO {band_table} (product_id, band, bucket) VALUES (%s, %s, %s)',
+                bands,
+            )
+
+
+def unindex_products(product_ids):
+    from .models import ProductBand, ProductSignature
+
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        ProductBand.objects.using(DEFAULT_DB_ALIAS).filter(product_id__in=product_ids).delete()
+        ProductSignature.objects.using(DEFAULT_DB_ALIAS).filter(product_id__in=product_ids).delete()
+
+
+# El índice vive en 'default' y el producto en su shard: una sola
+# transacción no abarca ambos, así que el índice se escribe tras el
+# COMMIT del shard (transaction.on_commit). Si el save se deshace, el
+# índice no cambia; si el proceso cae entre ambos, --rebuild lo repara.
+
+@receiver(post_save, sender='products.Product', dispatch_uid='products_dedup_index')
+def index_on_save(sender, instance, using, update_fields=None, **kwargs):
+    if changes.is_suppressed():
+        return
+    if update_fields is not None and not {'name', 'description'} & set(update_fields):
+        return
+    transaction.on_commit(lambda: index_products([instance]), using=using)
+
+
+@receiver(post_delete, sender='products.Product', dispatch_uid='products_dedup_unindex')
+def unindex_on_delete(sender, instance, using, **kwargs):
+    if not changes.is_suppressed():
+        pk = instance.pk
+        transaction.on_commit(lambda: unindex_products([pk]), using=using)
+
+
+# ── Agrupación (clusters) ────────────────────────────────────────
+
+def candidate_groups():
+    """
+    Grupos de productos que comparten alguna banda. Una consulta por
+    banda: los buckets repetidos se calculan en SQL
+    (GROUP BY bucket HAVING COUNT(*) > 1) y las filas llegan ordenadas.
+    """
+    from .models import ProductBand
+
+    bands = ProductBand.objects.using(DEFAULT_DB_ALIAS)
+    for band in range(BANDS):
+        shared = (
+            bands.filter(band=band)
+            .values('bucket')
+            .annotate(total=Count('id'))
+            .filter(total__gt=1)
+            .values('bucket')
+        )
+        rows = (
+            bands.filter(band=band, bucket__in=shared)
+            .order_by('bucket')
+            .values_list('bucket', 'product_id')
+        )
+        for _, group in itertools.groupby(rows.iterator(chunk_size=5000), key=lambda row: row[0]):
+            yield [product_id for _, product_id in group]
+
+
+def cluster(threshold=DUPLICATE_THRESHOLD):
+    """
+    Devuelve una lista de clusters (listas de ids) de casi duplicados.
+    Sólo se cargan en memoria las firmas de productos candidatos, y se
+    piden por lotes (una consulta cada SIGNATURE_BATCH ids).
+    """
+    from .models import ProductSignature
+
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    cache = {}
+    signatures = ProductSignature.objects.using(DEFAULT_DB_ALIAS)
+
+    def verify(groups):
+        missing = list({pk for group in groups for pk in group if pk not in cache})
+        for start in range(0, len(missing), SIGNATURE_BATCH):
+            chunk = signatures.filter(product_id__in=missing[start:start + SIGNATURE_BATCH])
+            cache.update((pk, from_bytes(raw)) for pk, raw in chunk.values_list('product_id', 'minhash'))
+
+        for group in groups:
+            # Cada producto se compara con un representante por cluster del grupo
+            representatives = []
+            for pk in group:
+                for rep in representatives:
+                    if similarity(cache[rep], cache[pk]) >= threshold:
+                        parent[find(pk)] = find(rep)
+                        break
+                else:
+                    representatives.append(pk)
+
+    pending = []
+    for group in candidate_groups():
+        pending.append(group)
+        if sum(len(g) for g in pending) >= SIGNATURE_BATCH:
+            verify(pending)
+            pending = []
+    verify(pending)
+
+    clusters = {}
+    for pk in parent:
+        clusters.setdefault(find(pk), []).append(pk)
+    return [sorted(ids) for ids in clusters.values() if len(ids) > 1]
@@ -7,10 +7,15 @@ MVC Role: MODEL / CONTROLLER
   - En lugar de forms.Form, heredamos de forms.ModelForm.
   - Genera automáticamente los campos HTML basados en la base de datos.
   - Implementa clean_<field> para validación extra.
+  - clean() rechaza el texto idéntico a otro producto y pide
+    confirmación ("Crear de todas formas") si es muy parecido
+    (products/dedup.py): las variantes reales (iPhone 14 Pro /
+    iPhone 15 Pro, talla M / talla L) superan el umbral.
 ─────────────────────────────────────────────────────────────────
 """
 
 from django import forms
+from . import dedup
 from .models import Product
 
 class ProductForm(forms.ModelForm):
@@ -18,7 +23,17 @@ class ProductForm(forms.ModelForm):
     Formulario basado en el Modelo Product.
     Mapea campos del Modelo directamente al HTML.
     """
-    
+
+    # Sólo se muestra tras avisar de un producto parecido
+    confirm_duplicate = forms.BooleanField(
+        required=False,
+        label='Crear de todas formas',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
+    # True si clean() encontró un producto parecido (no idéntico)
+    similar_found = False
+
     class Meta:
         model = Product
         fields = ['name', 'price', 'description']
@@ -50,3 +65,36 @@ class ProductForm(forms.ModelForm):
         if price is not None and price <= 0:
             raise forms.ValidationError('El precio debe ser un número entero mayor a 0.')
         return price
+
+    def clean(self):
+        """
+        Validación de casi duplicados.
+        Consulta el índice MinHash/LSH en lugar de recorrer el catálogo.
+        Texto idéntico (mismo hash) → error; parecido → aviso que se
+        salta marcando confirm_duplicate.
+        """
+        cleaned_data = super().clean()
+        name = cleaned_data.get('name')
+        if not name:
+            return cleaned_data
+
+        description = cleaned_data.get('description')
+        exact_id = dedup.exact_duplicate(name, description, exclude_id=self.instance.pk)
+        if exact_id:
+            raise forms.ValidationError(
+                'Ya existe un producto con el mismo nombre y descripción (#%(id)s).',
+                params={'id': exact_id},
+            )
+
+        if cleaned_data.get('confirm_duplicate'):
+            return cleaned_data
+        matches = dedup.find_duplicates(name, description, exclude_id=self.instance.pk)
+        if matches:
+            product_id, score = matches[0]
+            self.similar_found = True
+            raise forms.ValidationError(
+                'Hay un producto muy parecido (#%(id)s, similitud %(score)d%%). '
+                'Si es otra variante, marque "Crear de todas formas".',
+                params={'id': product_id, 'score': round(score * 100)},
+            )
+        return cleaned_data
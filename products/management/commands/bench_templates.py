@@ -0,0 +1,77 @@
+"""
+products/management/commands/bench_templates.py
+================================================
+COMANDO DE GESTIÓN — Benchmark de motores de plantillas
+─────────────────────────────────────────────────────────────────
+Renderiza products/index.html con N productos (en memoria, sin BBDD)
+con DjangoTemplates y con Jinja2, y compara los tiempos.
+
+  python manage.py bench_templates
+  python manage.py bench_templates --products 100 --iterations 500
+─────────────────────────────────────────────────────────────────
+"""
+
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.test import RequestFactory
+from django.utils import timezone
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Compara DjangoTemplates y Jinja2 renderizando el índice de productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=300)
+        parser.add_argument('--template', default='products/index.html')
+
+    def handle(self, *args, **options):
+        available = [alias for alias in ('django', 'jinja2') if alias in engines]
+        if 'jinja2' not in available:
+            raise CommandError('Jinja2 no está instalado: pip install jinja2')
+
+        request = RequestFactory().get('/products/')
+        now = timezone.now()
+        context = {
+            'title': 'Nuestros Productos',
+            'header_title': 'Products Catalog',
+            'products': [
+                Product(
+                    id=i,
+                    name=f'Producto de prueba número {i}',
+                    price=100 + i,
+                    description='Descripción larga de ejemplo ' * 5 if i % 3 else None,
+                    created_at=now - timedelta(hours=i),
+                    updated_at=now,
+                )
+                for i in range(1, options['products'] + 1)
+            ],
+            'next_cursor': 'abc',
+        }
+
+        results = {}
+        for alias in available:
+            template = engines[alias].get_template(options['template'])
+            template.render(context, request)  # calentamiento (compilación)
+            timings = []
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                template.render(context, request)
+                timings.append((time.perf_counter() - start) * 1000)
+            results[alias] = timings
+            self.stdout.write(
+                f'{alias:<8} media {statistics.mean(timings):7.3f} ms   '
+                f'mediana {statistics.median(timings):7.3f} ms   '
+                f'p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:7.3f} ms'
+            )
+
+        speedup = statistics.median(results['django']) / statistics.median(results['jinja2'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Jinja2 es {speedup:.1f}× más rápido con {options["products"]} productos.'
+        ))
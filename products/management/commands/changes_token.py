@@ -0,0 +1,28 @@
+"""
+products/management/commands/changes_token.py
+=============================================
+COMANDO DE GESTIÓN — Token de acceso al feed de cambios
+─────────────────────────────────────────────────────────────────
+Imprime un token firmado para la cabecera X-Changes-Token de
+GET /products/changes/ (válido CHANGES_TOKEN_MAX_AGE segundos).
+
+  curl -H "X-Changes-Token: $(python manage.py changes_token --consumer search)" \
+       http://localhost:8000/products/changes/
+─────────────────────────────────────────────────────────────────
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products import changes
+
+
+class Command(BaseCommand):
+    help = 'Imprime un token firmado para leer /products/changes/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', required=True, help='Nombre del consumidor que usará el token')
+
+    def handle(self, *args, **options):
+        self.stdout.write(changes.make_consumer_token(options['consumer']))
+        self.stderr.write(f'válido durante {settings.CHANGES_TOKEN_MAX_AGE} segundos')
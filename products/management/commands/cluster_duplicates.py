@@ -0,0 +1,106 @@
+"""
+products/management/commands/cluster_duplicates.py
+==================================================
+COMANDO DE GESTIÓN — Agrupar productos casi duplicados
+─────────────────────────────────────────────────────────────────
+Se ejecuta con:
+  python manage.py cluster_duplicates --rebuild
+  python manage.py cluster_duplicates --threshold 0.9 --show 20
+
+  --rebuild  recalcula el índice MinHash/LSH de TODO el catálogo
+             (todos los shards, por lotes keyset sobre id). Cada lote
+             se reemplaza en su propia transacción, así que el índice
+             nunca queda vacío mientras el formulario lo consulta; al
+             final se borran las firmas de productos que ya no existen.
+  Después agrupa en SQL los productos que comparten banda y
+  verifica cada candidato con la firma MinHash.
+
+Imprime el rendimiento (filas/s) de cada fase.
+─────────────────────────────────────────────────────────────────
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from products import dedup, sharding
+from products.models import Product, ProductSignature
+
+
+class Command(BaseCommand):
+    help = 'Agrupa los productos casi duplicados de todo el catálogo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Reconstruye el índice antes de agrupar')
+        parser.add_argument('--threshold', type=float, default=dedup.DUPLICATE_THRESHOLD)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--show', type=int, default=10, help='Clusters a mostrar')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self._rebuild(options['batch_size'])
+
+        started = time.perf_counter()
+        clusters = dedup.cluster(threshold=options['threshold'])
+        elapsed = time.perf_counter() - started
+
+        indexed = ProductSignature.objects.using(DEFAULT_DB_ALIAS).count()
+        duplicates = sum(len(ids) - 1 for ids in clusters)
+        self.stdout.write(
+            f'{len(clusters)} clusters, {duplicates} productos sobrantes '
+            f'({indexed} indexados, {elapsed:.1f}s, {indexed / max(elapsed, 1e-9):,.0f} filas/s)'
+        )
+
+        for ids in sorted(clusters, key=len, reverse=True)[:options['show']]:
+            names = [product.name for product in self._products(ids[:3])]
+            self.stdout.write(f'  {len(ids)} × {ids[:10]} {names}')
+
+    def _rebuild(self, batch_size):
+        started, total = time.perf_counter(), 0
+        for alias in sharding.shard_aliases():
+            last_pk = 0
+            while True:
+                batch = list(
+                    Product.objects.using(alias)
+                    .filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .only('pk', 'name', 'description')[:batch_size]
+                )
+                if not batch:
+                    break
+                dedup.index_products(batch, replace=True)
+                total += len(batch)
+                last_pk = batch[-1].pk
+
+        removed = self._remove_orphans(batch_size)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'índice reconstruido: {total} productos en {elapsed:.1f}s '
+                          f'({total / max(elapsed, 1e-9):,.0f} filas/s), {removed} firmas huérfanas borradas')
+
+    def _remove_orphans(self, batch_size):
+        """Firmas cuyo producto ya no está en su shard."""
+        signatures = ProductSignature.objects.using(DEFAULT_DB_ALIAS).order_by('product_id')
+        removed, last_id = 0, 0
+        while True:
+            ids = list(signatures.filter(product_id__gt=last_id).values_list('product_id', flat=True)[:batch_size])
+            if not ids:
+                return removed
+            by_alias = {}
+            for pk in ids:
+                by_alias.setdefault(sharding.alias_for(pk), []).append(pk)
+            existing = set()
+            for alias, pks in by_alias.items():
+                existing.update(Product._base_manager.using(alias).filter(pk__in=pks).values_list('pk', flat=True))
+            orphans = [pk for pk in ids if pk not in existing]
+            if orphans:
+                dedup.unindex_products(orphans)
+                removed += len(orphans)
+            last_id = ids[-1]
+
+    def _products(self, ids):
+        return [
+            product
+            for pk in ids
+            for product in Product.objects.for_id(pk).filter(pk=pk)
+        ]
@@ -0,0 +1,28 @@
+"""
+products/management/commands/compact_changes.py
+===============================================
+COMANDO DE GESTIÓN — Compactar el outbox de cambios
+─────────────────────────────────────────────────────────────────
+Borra los eventos antiguos que todos los consumidores registrados
+(ChangeConsumer) ya han procesado.
+
+  python manage.py compact_changes --days 7
+─────────────────────────────────────────────────────────────────
+"""
+
+from django.core.management.base import BaseCommand
+
+from products import changes
+
+
+class Command(BaseCommand):
+    help = 'Elimina eventos antiguos del outbox ya leídos por todos los consumidores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Conserva los eventos de los últimos N días')
+
+    def handle(self, *args, **options):
+        deleted = changes.compact(older_than_days=options['days'])
+        for alias, count in deleted.items():
+            self.stdout.write(f'{alias}: {count} eventos eliminados')
+        self.stdout.write(self.style.SUCCESS('Compactación completada.'))
@@ -0,0 +1,222 @@
+"""
+products/management/commands/rebalance_shards.py
+================================================
+COMANDO DE GESTIÓN — Mover rangos de buckets entre shards
+─────────────────────────────────────────────────────────────────
+Se ejecuta con:
+  python manage.py rebalance_shards --show
+  python manage.py rebalance_shards --buckets 0-15 --to shard_1
+
+Movimiento en caliente del rango (sin parar la web):
+  1. Copia productos y comentarios del rango al shard destino (por lotes).
+  2. Cambia el mapa en ShardBucket → las nuevas escrituras van al destino.
+  3. Espera PRODUCT_SHARD_MAP_TTL (+ margen) para que todos los procesos
+     recarguen el mapa.
+  4. Sincroniza lo que cambió en el origen desde el paso 1 y recalcula
+     Product.comment_count en el destino (ver "Paso 4" más abajo).
+  5. Borra el rango del shard origen.
+
+Paso 4 — el outbox (ChangeEvent) de cada shard dice qué objetos se
+tocaron y cuándo. Para cada producto/comentario del rango con eventos
+en el origen desde el paso 1:
+  - si el destino tiene un evento posterior del mismo objeto, gana
+    el destino (se editó o borró ya con el mapa nuevo);
+  - si no, se aplica el estado actual del origen: UPSERT si la fila
+    existe (para productos sólo si su updated_at no es más antiguo que
+    el del destino) o DELETE si se borró.
+
+Limitación: las escrituras que no pasan por el outbox (SQL crudo o
+dentro de changes.suppressed()) durante los pasos 1-3 no se propagan.
+─────────────────────────────────────────────────────────────────
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from products import changes, comments, sharding
+from products.models import ChangeEvent, Comment, Product, ShardBucket
+
+# Modelos que mueve el comando, en orden de dependencia (FK)
+MOVED_MODELS = [Product, Comment]
+
+
+class Command(BaseCommand):
+    help = 'Mueve un rango de buckets de productos (y sus comentarios) a otro shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show', action='store_true', help='Muestra el mapa bucket → shard actual')
+        parser.add_argument('--buckets', help='Rango de buckets, p. ej. 0-15 o 7')
+        parser.add_argument('--to', dest='target', help='Alias del shard destino')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace', type=float, default=1.0,
+                            help='Segundos extra de espera tras cambiar el mapa')
+
+    def handle(self, *args, **options):
+        if not sharding.is_enabled():
+            raise CommandError('El sharding está desactivado (PRODUCT_SHARD_COUNT=0).')
+
+        if options['show']:
+            self._show()
+            return
+
+        if not options['buckets'] or not options['target']:
+            raise CommandError('Indica --buckets y --to (o usa --show).')
+
+        target = options['target']
+        if target not in sharding.shard_aliases():
+            raise CommandError(f'"{target}" no es un shard: {sharding.shard_aliases()}')
+
+        self.batch_size = options['batch_size']
+        sharding.invalidate_shard_map()
+        mapping = sharding.shard_map()
+
+        # Agrupa los buckets por shard origen: una sola espera por origen
+        by_source = {}
+        for bucket in self._parse_range(options['buckets']):
+            if mapping[bucket] != target:
+                by_source.setdefault(mapping[bucket], []).append(bucket)
+
+        # Mover filas no es un cambio de negocio: nada al outbox
+        with changes.suppressed():
+            for source, buckets in by_source.items():
+                self._move(buckets, source, target, options['grace'])
+
+        self.stdout.write(self.style.SUCCESS('Rebalanceo completado.'))
+
+    # ── Pasos ────────────────────────────────────────────────────
+
+    def _move(self, buckets, source, target, grace):
+        started = timezone.now()
+        self.stdout.write(f'buckets {buckets[0]}-{buckets[-1]} ({len(buckets)}): {source} → {target}')
+
+        copied = self._copy(buckets, source, target)
+        self.stdout.write(f'  copiados {copied[0]} productos / {copied[1]} comentarios')
+
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            for bucket in buckets:
+                ShardBucket.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+                    bucket=bucket, defaults={'alias': target},
+                )
+        sharding.invalidate_shard_map()
+
+        time.sleep(getattr(settings, 'PRODUCT_SHARD_MAP_TTL', 5) + grace)
+
+        synced = self._sync(buckets, source, target, since=started)
+        self.stdout.write(f'  sincronizados {synced[0]} productos / {synced[1]} comentarios')
+        # Las copias no pasan por el contador de comentarios (suppressed)
+        comments.recount(self._products(buckets, target))
+
+        with transaction.atomic(using=source):
+            self._products(buckets, source).delete()
+
+    def _copy(self, buckets, source, target):
+        products = self._products(buckets, source)
+        comments = Comment.objects.using(source).annotate(
+            bucket=F('product_id') % sharding.bucket_count(),
+        ).filter(bucket__in=buckets)
+
+        product_fields = ['name', 'price', 'description', 'created_at', 'updated_at', 'comment_count']
+        total_products = self._copy_batches(Product, products, target, product_fields)
+        total_comments = self._copy_batches(Comment, comments, target, ['product', 'description', 'created_at'])
+        return total_products, total_comments
+
+    def _sync(self, buckets, source, target, since):
+        """Paso 4: propaga al destino los cambios del origen que no pisen otros más nuevos."""
+        source_events = self._last_events(source, since)
+        target_events = self._last_events(target, since)
+        totals = []
+        for model in MOVED_MODELS:
+            label = model._meta.label_lower
+            pending = [
+                pk for (event_model, pk), at in source_events.items()
+                if event_model == label and (target_events.get((label, pk)) is None or at > target_events[(label, pk)])
+            ]
+            total = 0
+            for start in range(0, len(pending), self.batch_size):
+                total += self._sync_batch(model, pending[start:start + self.batch_size], buckets, source, target)
+            totals.append(total)
+        return totals
+
+    def _sync_batch(self, model, pks, buckets, source, target):
+        on_source = model._base_manager.using(source).in_bulk(pks)
+        on_target = model._base_manager.using(target).in_bulk(pks)
+        upserts, deletes = [], []
+        for pk in pks:
+            row, current = on_source.get(pk), on_target.get(pk)
+            if not self._in_buckets(row or current, buckets):
+                continue
+            if row is None:
+                deletes.append(pk)
+            elif current is None or not hasattr(row, 'updated_at') or row.updated_at >= current.updated_at:
+                upserts.append(row)
+
+        fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+        with transaction.atomic(using=target):
+            model._base_manager.using(target).filter(pk__in=deletes).delete()
+            sharding.upsert_rows(model, upserts, target, fields)
+        return len(upserts) + len(deletes)
+
+    def _last_events(self, alias, since):
+        """{(modelo, id): fecha del último evento} del outbox de `alias`."""
+        labels = [model._meta.label_lower for model in MOVED_MODELS]
+        events = (
+            ChangeEvent.objects.using(alias)
+            .filter(created_at__gte=since, model__in=labels)
+            .order_by()
+            .values('model', 'object_id')
+            .annotate(last=Max('created_at'))
+        )
+        return {(event['model'], event['object_id']): event['last'] for event in events}
+
+    def _in_buckets(self, obj, buckets):
+        if obj is None:
+            return False
+        product_id = obj.product_id if isinstance(obj, Comment) else obj.pk
+        return sharding.bucket_for(product_id) in buckets
+
+    def _copy_batches(self, model, queryset, target, fields):
+        """Copia por keyset sobre id; los conflictos se resuelven con UPSERT."""
+        total, last_pk = 0, 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:self.batch_size])
+            if not batch:
+                return total
+            with transaction.atomic(using=target):
+                sharding.upsert_rows(model, batch, target, fields)
+            total += len(batch)
+            last_pk = batch[-1].pk
+
+    def _products(self, buckets, alias):
+        return Product.objects.using(alias).annotate(
+            bucket=F('id') % sharding.bucket_count(),
+        ).filter(bucket__in=buckets)
+
+    # ── Utilidades ───────────────────────────────────────────────
+
+    def _parse_range(self, value):
+        try:
+            start, _, end = value.partition('-')
+            start, end = int(start), int(end or start)
+        except ValueError:
+            raise CommandError(f'Rango de buckets inválido: "{value}"')
+        if not 0 <= start <= end < sharding.bucket_count():
+            raise CommandError(f'Los buckets van de 0 a {sharding.bucket_count() - 1}.')
+        return range(start, end + 1)
+
+    def _show(self):
+        sharding.invalidate_shard_map()
+        mapping = sharding.shard_map()
+        ranges = []
+        for bucket in range(sharding.bucket_count()):
+            alias = mapping[bucket]
+            if ranges and ranges[-1][2] == alias and ranges[-1][1] == bucket - 1:
+                ranges[-1][1] = bucket
+            else:
+                ranges.append([bucket, bucket, alias])
+        for start, end, alias in ranges:
+            self.stdout.write(f'{start:>3}-{end:<3} → {alias}')
@@ -0,0 +1,69 @@
+"""
+products/management/commands/rebuild_related.py
+================================================
+COMANDO DE GESTIÓN — Recalcular "Frecuentemente comprados juntos"
+─────────────────────────────────────────────────────────────────
+Recorre todos los CartEvent y reescribe ProductPair con los top-k
+pares de cada producto. Memoria acotada por --max-pairs: si una
+pasada no cabe, se duplican las particiones automáticamente (hasta
+MAX_PARTITIONS; a partir de ahí se podan los pares menos frecuentes).
+
+  python manage.py rebuild_related
+  python manage.py rebuild_related --partitions 8 --keep 10 --min-count 2
+─────────────────────────────────────────────────────────────────
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la tabla de productos comprados juntos a partir de los carritos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partitions', type=int, default=1,
+                            help='Pasadas iniciales (product_id %% P)')
+        parser.add_argument('--keep', type=int, default=recommendations.RELATED_KEEP,
+                            help='Pares que se guardan por producto')
+        parser.add_argument('--min-count', type=int, default=1,
+                            help='Descarta pares vistos menos de N veces')
+        parser.add_argument('--max-pairs', type=int, default=recommendations.MAX_PAIRS_IN_MEMORY,
+                            help='Pares distintos en memoria por pasada')
+        parser.add_argument('--chunk-size', type=int, default=recommendations.EVENT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['partitions'] < 1 or options['keep'] < 1 or options['max_pairs'] < 1:
+            raise CommandError('--partitions, --keep y --max-pairs deben ser mayores que 0')
+        if options['max_pairs'] < recommendations.MAX_CART_SIZE - 1:
+            raise CommandError(
+                f'--max-pairs debe ser al menos {recommendations.MAX_CART_SIZE - 1} '
+                f'(pares de un producto en un carrito de MAX_CART_SIZE)'
+            )
+
+        started = time.monotonic()
+        written = 0
+        for step in recommendations.rebuild(
+            partitions=options['partitions'],
+            keep=options['keep'],
+            min_count=options['min_count'],
+            max_pairs=options['max_pairs'],
+            chunk_size=options['chunk_size'],
+        ):
+            if 'restart' in step:
+                self.stdout.write(self.style.WARNING(
+                    f'No cabe en memoria; reiniciando con {step["restart"]} particiones'
+                ))
+                continue
+            written += step['written']
+            pruned = f' ({step["pruned"]} podados)' if step['pruned'] else ''
+            self.stdout.write(
+                f'partición {step["part"] + 1}/{step["partitions"]}: '
+                f'{step["carts"]} carritos, {step["pairs"]} pares{pruned}, {step["written"]} guardados'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{written} pares guardados en {time.monotonic() - started:.1f} s.'
+        ))
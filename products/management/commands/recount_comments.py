@@ -0,0 +1,53 @@
+"""
+products/management/commands/recount_comments.py
+================================================
+COMANDO DE GESTIÓN — Recalcular Product.comment_count
+─────────────────────────────────────────────────────────────────
+El contador se mantiene con señales y en CommentQuerySet, pero el SQL
+escrito a mano o los borrados fuera del ORM no pasan por ahí. Este
+comando compara el contador con las filas de cada shard, por lotes
+keyset sobre id, y corrige los productos que se han desviado.
+
+  python manage.py recount_comments --dry-run
+  python manage.py recount_comments --batch-size 5000
+─────────────────────────────────────────────────────────────────
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import comments, sharding
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el contador de comentarios de cada producto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Sólo cuenta los productos desviados')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size debe ser mayor que 0')
+
+        checked = drifted = 0
+        for alias in sharding.shard_aliases():
+            products = Product._base_manager.using(alias)
+            last_pk = in_shard = 0
+            while True:
+                ids = list(products.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                batch = products.filter(pk__gt=last_pk, pk__lte=ids[-1])
+                wrong = comments.drifted(batch).count()
+                if wrong and not options['dry_run']:
+                    comments.recount(batch)
+                in_shard += len(ids)
+                drifted += wrong
+                last_pk = ids[-1]
+            checked += in_shard
+            self.stdout.write(f'  {alias}: {in_shard} productos')
+
+        verb = 'desviados' if options['dry_run'] else 'corregidos'
+        self.stdout.write(self.style.SUCCESS(f'{checked} productos revisados, {drifted} {verb}.'))
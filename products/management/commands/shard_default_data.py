@@ -0,0 +1,117 @@
+"""
+products/management/commands/shard_default_data.py
+==================================================
+COMANDO DE GESTIÓN — Repartir los datos de 'default' entre los shards
+─────────────────────────────────────────────────────────────────
+Al activar el sharding (PRODUCT_SHARD_COUNT > 0) los productos y
+comentarios creados antes siguen en db.sqlite3, fuera de todos los
+shards. Este comando los copia a su shard (mismo id, mismas fechas),
+ajusta ShardSequence para que los ids nuevos no colisionen y los borra
+de 'default'.
+
+  python manage.py shard_default_data --dry-run
+  python manage.py shard_default_data
+  python manage.py shard_default_data --keep-default
+
+Si algún id ya existe en un shard (p. ej. se crearon productos con el
+sharding activo antes de repartir) el comando se detiene sin escribir.
+─────────────────────────────────────────────────────────────────
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Max
+
+from products import changes, sharding
+from products.models import Comment, Product, ShardSequence
+
+# Modelos a repartir, en orden de dependencia (FK)
+MOVED_MODELS = [Product, Comment]
+
+
+class Command(BaseCommand):
+    help = "Copia a su shard los productos y comentarios que quedaron en 'default'"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Sólo cuenta y comprueba colisiones')
+        parser.add_argument('--keep-default', action='store_true', help="No borra las filas de 'default'")
+
+    def handle(self, *args, **options):
+        if not sharding.is_enabled():
+            raise CommandError('El sharding está desactivado (PRODUCT_SHARD_COUNT=0).')
+        self.batch_size = options['batch_size']
+
+        counts = {model: model._base_manager.using(DEFAULT_DB_ALIAS).count() for model in MOVED_MODELS}
+        self.stdout.write(f"'default': {counts[Product]} productos / {counts[Comment]} comentarios")
+        if not any(counts.values()):
+            self.stdout.write(self.style.SUCCESS('Nada que repartir.'))
+            return
+
+        collisions = {model: self._collisions(model) for model in MOVED_MODELS}
+        if any(collisions.values()):
+            for model, pks in collisions.items():
+                if pks:
+                    self.stderr.write(f'{model._meta.label}: ids ya presentes en un shard: {pks[:20]}')
+            raise CommandError('Hay ids repetidos en los shards; no se ha copiado nada.')
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Sin colisiones.'))
+            return
+
+        # Copiar filas no es un cambio de negocio: nada al outbox ni al índice
+        with changes.suppressed():
+            for model in MOVED_MODELS:
+                copied = self._copy(model)
+                self.stdout.write(f'  {model._meta.label}: {copied} filas copiadas')
+            self._advance_sequences()
+            if not options['keep_default']:
+                self._delete_default()
+
+        self.stdout.write(self.style.SUCCESS('Datos repartidos entre los shards.'))
+
+    def _batches(self, model):
+        """Filas de 'default' por keyset sobre id."""
+        rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:self.batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def _collisions(self, model):
+        found = []
+        for batch in self._batches(model):
+            pks = [obj.pk for obj in batch]
+            for alias in sharding.shard_aliases():
+                found += model._base_manager.using(alias).filter(pk__in=pks).values_list('pk', flat=True)
+        return sorted(found)
+
+    def _copy(self, model):
+        fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+        total = 0
+        for batch in self._batches(model):
+            by_alias = {}
+            for obj in batch:
+                by_alias.setdefault(sharding.alias_for_instance(obj), []).append(obj)
+            for alias, group in by_alias.items():
+                with transaction.atomic(using=alias):
+                    sharding.upsert_rows(model, group, alias, fields)
+            total += len(batch)
+        return total
+
+    def _advance_sequences(self):
+        """Una secuencia ya creada no puede volver a repartir ids copiados."""
+        for model in MOVED_MODELS:
+            highest = model._base_manager.using(DEFAULT_DB_ALIAS).aggregate(m=Max('pk'))['m'] or 0
+            ShardSequence.objects.using(DEFAULT_DB_ALIAS).filter(
+                name=model._meta.label_lower, next_value__lte=highest,
+            ).update(next_value=highest + 1)
+
+    def _delete_default(self):
+        # Los comentarios caen en cascada con su producto
+        for batch in self._batches(Product):
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                Product._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__in=[p.pk for p in batch]).delete()
+        Comment._base_manager.using(DEFAULT_DB_ALIAS).all().delete()
@@ -0,0 +1,52 @@
+"""
+products/management/commands/tail_changes.py
+============================================
+COMANDO DE GESTIÓN — Leer el outbox de cambios
+─────────────────────────────────────────────────────────────────
+Imprime los eventos de ChangeEvent como JSON (una línea por evento).
+
+  python manage.py tail_changes --consumer search --follow
+  python manage.py tail_changes --since 120 --batch-size 1000
+
+Con --consumer la posición se guarda en ChangeConsumer después de
+cada lote, así que al reiniciar se continúa donde se dejó.
+─────────────────────────────────────────────────────────────────
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import changes
+
+
+class Command(BaseCommand):
+    help = 'Lee el outbox de cambios de productos y comentarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', help='Nombre del consumidor (guarda checkpoint)')
+        parser.add_argument('--since', help='Token de inicio (por defecto: checkpoint o inicio)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--follow', action='store_true', help='Sigue esperando nuevos eventos')
+        parser.add_argument('--interval', type=float, default=1.0, help='Segundos entre sondeos con --follow')
+
+    def handle(self, *args, **options):
+        consumer = options['consumer']
+        token = options['since']
+        if token is None and consumer:
+            token = changes.get_checkpoint(consumer)
+
+        while True:
+            events, token = changes.read_changes(token, limit=options['batch_size'])
+            for event in events:
+                self.stdout.write(json.dumps(changes.as_dict(event), default=str))
+            if events and consumer:
+                changes.save_checkpoint(consumer, token)
+
+            if len(events) < options['batch_size']:
+                if not options['follow']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stderr.write(f'posición: {token}')
@@ -0,0 +1,242 @@
+"""
+products/managers.py
+====================
+MANAGERS CONSCIENTES DEL SHARDING
+─────────────────────────────────────────────────────────────────
+Product.objects y Comment.objects siguen funcionando como siempre
+(sin sharding todo apunta a 'default'), pero añaden métodos para
+encontrar el shard correcto sin que la vista tenga que saberlo:
+
+  Product.objects.for_id(pk)            → QuerySet en el shard de pk
+  Product.objects.across_shards(...)    → scatter-gather ordenado
+  Product.objects.delete_everywhere()   → borra en todos los shards
+  Comment.objects.page_for_product(...) → una página keyset de comentarios
+
+Además, sus QuerySets registran en el outbox (products/changes.py)
+las escrituras masivas: update(), bulk_update() y bulk_create(), y
+ProductQuerySet mantiene el índice de duplicados (products/dedup.py)
+y CommentQuerySet el contador Product.comment_count (products/comments.py),
+también en delete() y update(product=…).
+─────────────────────────────────────────────────────────────────
+"""
+
+from collections import Counter
+
+from django.db import models, transaction
+
+from . import changes, comments, dedup, sharding
+
+# Tamaño de lote al releer filas actualizadas para el outbox
+CHANGE_BATCH_SIZE = 500
+
+
+class ChangeLogQuerySet(models.QuerySet):
+    """QuerySet cuyas escrituras masivas dejan rastro en el outbox."""
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            fresh = self.model._base_manager.using(self.db)
+            for start in range(0, len(pks), CHANGE_BATCH_SIZE):
+                batch = fresh.filter(pk__in=pks[start:start + CHANGE_BATCH_SIZE])
+                changes.record(batch, changes.UPDATE, using=self.db)
+        return rows
+
+    update.alters_data = True
+
+    def create(self, **kwargs):
+        """
+        Sin `using` explícito el shard lo elige Model.save() (el router
+        no puede: la fila aún no tiene id).
+        """
+        if self._db is not None or not sharding.is_enabled():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+    create.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Sin `using` explícito y con sharding activo, reserva los ids y
+        reparte los objetos por shard antes de insertarlos.
+        """
+        objs = list(objs)
+        if self._db is not None or not sharding.is_enabled():
+            return self._bulk_create_and_record(self.db, objs, *args, **kwargs)
+
+        by_alias = {}
+        for obj in objs:
+            if obj.pk is None:
+                obj.pk = sharding.allocate_id(self.model)
+            by_alias.setdefault(sharding.alias_for_instance(obj), []).append(obj)
+        for alias, group in by_alias.items():
+            self._bulk_create_and_record(alias, group, *args, **kwargs)
+        return objs
+
+    bulk_create.alters_data = True
+
+    def _bulk_create_and_record(self, alias, objs, *args, **kwargs):
+        with transaction.atomic(using=alias):
+            created = super(ChangeLogQuerySet, self.using(alias)).bulk_create(objs, *args, **kwargs)
+            # Con update_conflicts una fila puede ser create o update: se registra como create
+            changes.record([obj for obj in created if obj.pk is not None], changes.CREATE, using=alias)
+        return created
+
+
+class ProductQuerySet(ChangeLogQuerySet):
+    """
+    Escrituras masivas de Product que también actualizan el índice de
+    duplicados, tras el COMMIT del shard (ver products/dedup.py).
+    """
+
+    def update(self, **kwargs):
+        if changes.is_suppressed() or not {'name', 'description'} & set(kwargs):
+            return super().update(**kwargs)
+        alias = self.db
+        pks = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        transaction.on_commit(lambda: self._reindex(alias, pks), using=alias)
+        return rows
+
+    update.alters_data = True
+
+    def _reindex(self, alias, pks):
+        fresh = self.model._base_manager.using(alias)
+        for start in range(0, len(pks), CHANGE_BATCH_SIZE):
+            dedup.index_products(fresh.filter(pk__in=pks[start:start + CHANGE_BATCH_SIZE]))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        if not changes.is_suppressed():
+            by_alias = {}
+            for obj in created:
+                by_alias.setdefault(obj._state.db, []).append(obj)
+            for alias, group in by_alias.items():
+                transaction.on_commit(lambda group=group: dedup.index_products(group), using=alias)
+        return created
+
+    bulk_create.alters_data = True
+
+    def bulk_create_unique(self, objs, threshold=dedup.DUPLICATE_THRESHOLD, **kwargs):
+        """
+        bulk_create que descarta los casi duplicados, tanto contra el
+        catálogo como dentro del propio lote. Devuelve (creados, descartados).
+        """
+        accepted, skipped, seen = [], [], {}
+        for obj in objs:
+            text = dedup.product_text(obj.name, obj.description)
+            signature = dedup.minhash(text)
+            keys = list(enumerate(dedup.band_buckets(signature)))
+            in_batch = any(
+                dedup.similarity(signature, other) >= threshold
+                for key in keys
+                for other in seen.get(key, ())
+            )
+            if in_batch or dedup.find_duplicates(obj.name, obj.description, threshold=threshold):
+                skipped.append(obj)
+                continue
+            accepted.append(obj)
+            for key in keys:
+                seen.setdefault(key, []).append(signature)
+        return self.bulk_create(accepted, **kwargs), skipped
+
+    bulk_create_unique.alters_data = True
+
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+
+    def for_id(self, pk):
+        """QuerySet situado en el shard que contiene el producto `pk`."""
+        return self.get_queryset().using(sharding.alias_for(pk))
+
+    def across_shards(self, limit=None, cursor=None, queryset=None):
+        """
+        Consulta todos los shards y mezcla por (-created_at, -id).
+        Devuelve (productos, next_cursor).
+        """
+        if queryset is None:
+            queryset = self.get_queryset()
+        return sharding.scatter_gather(queryset, limit=limit, cursor=cursor)
+
+    def in_bulk_across_shards(self, ids):
+        """{id: producto} agrupando los ids por shard (una consulta por shard)."""
+        by_alias = {}
+        for pk in ids:
+            by_alias.setdefault(sharding.alias_for(pk), []).append(pk)
+        found = {}
+        for alias, pks in by_alias.items():
+            found.update(self.get_queryset().using(alias).in_bulk(pks))
+        return found
+
+    def delete_everywhere(self):
+        for alias in sharding.shard_aliases():
+            self.get_queryset().using(alias).delete()
+
+
+class CommentQuerySet(ChangeLogQuerySet):
+    """Escrituras masivas de Comment que mantienen Product.comment_count."""
+
+    # comments.count_on_delete no descuenta de uno en uno lo que borra delete()
+    batches_comment_counts = True
+
+    def delete(self):
+        if changes.is_suppressed():
+            return super().delete()
+        with transaction.atomic(using=self.db):
+            per_product = self.order_by().values_list('product_id').annotate(total=models.Count('pk'))
+            removed = {product_id: -total for product_id, total in per_product}
+            deleted = super().delete()
+            comments.adjust_counts(removed, using=self.db)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def update(self, **kwargs):
+        if changes.is_suppressed() or not {'product', 'product_id'} & set(kwargs):
+            return super().update(**kwargs)
+        alias = self.db
+        with transaction.atomic(using=alias):
+            before = dict(self.values_list('pk', 'product_id'))
+            rows = super().update(**kwargs)
+            deltas = Counter()
+            fresh = self.model._base_manager.using(alias)
+            pks = list(before)
+            for start in range(0, len(pks), CHANGE_BATCH_SIZE):
+                batch = fresh.filter(pk__in=pks[start:start + CHANGE_BATCH_SIZE])
+                for pk, product_id in batch.values_list('pk', 'product_id'):
+                    if product_id != before[pk]:
+                        deltas[before[pk]] -= 1
+                        deltas[product_id] += 1
+            comments.adjust_counts({pk: delta for pk, delta in deltas.items() if delta}, using=alias)
+        return rows
+
+    update.alters_data = True
+
+    def _bulk_create_and_record(self, alias, objs, *args, **kwargs):
+        with transaction.atomic(using=alias):
+            created = super()._bulk_create_and_record(alias, objs, *args, **kwargs)
+            # Con update_conflicts no se sabe qué filas son nuevas: usar comments.recount()
+            if not changes.is_suppressed() and not kwargs.get('update_conflicts'):
+                comments.adjust_counts(Counter(obj.product_id for obj in created), using=alias)
+        return created
+
+
+class CommentManager(models.Manager.from_queryset(CommentQuerySet)):
+
+    def for_product(self, product_id):
+        """Comentarios de un producto, leídos en su shard."""
+        return self.get_queryset().using(sharding.alias_for(product_id)).filter(product_id=product_id)
+
+    def page_for_product(self, product_id, limit, cursor=None):
+        """
+        Los `limit` comentarios más recientes tras `cursor` (índice
+        products_comment_recent_idx). Devuelve (comentarios, next_cursor).
+        """
+        queryset = sharding.after_cursor(self.for_product(product_id), cursor)
+        rows = list(queryset.order_by('-created_at', '-pk')[:limit + 1])
+        next_cursor = sharding.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
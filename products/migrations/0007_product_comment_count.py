@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_comment_counts(apps, schema_editor):
+    # Se ejecuta en cada BBDD (default y shards); comentarios y producto comparten shard
+    Product = apps.get_model('products', 'Product')
+    Comment = apps.get_model('products', 'Comment')
+    alias = schema_editor.connection.alias
+    totals = Comment.objects.using(alias).order_by().values('product_id').annotate(total=Count('id'))
+    for row in totals.iterator():
+        Product.objects.using(alias).filter(pk=row['product_id']).update(comment_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_cartevent_productpair'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Comentarios'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='products_comment_recent_idx'),
+        ),
+        migrations.RunPython(
+            backfill_comment_counts,
+            migrations.RunPython.noop,
+            hints={'model_name': 'product'},
+        ),
+    ]
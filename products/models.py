@@ -9,8 +9,13 @@ MVC Role: MODEL
   - Cada instancia de un modelo = una fila en la tabla.
 
 Modelos definidos aquí:
-  Product  — tabla de productos
-  Comment  — tabla de comentarios (relación FK con Product)
+  Product       — tabla de productos
+  Comment       — tabla de comentarios (relación FK con Product)
+  ShardBucket   — mapa bucket → shard (ver products/sharding.py)
+  ShardSequence — contadores de ids globales entre shards
+  ChangeEvent   — outbox de cambios (ver products/changes.py)
+  ChangeConsumer — checkpoint de cada consumidor del outbox
+  ProductSignature / ProductBand — índice de casi duplicados (products/dedup.py)
 ─────────────────────────────────────────────────────────────────
 
 COMANDOS CLAVE:
@@ -24,8 +29,12 @@ COMANDOS CLAVE:
 ─────────────────────────────────────────────────────────────────
 """
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
+from . import changes, sharding
+from .managers import CommentManager, ProductManager
+
 
 # ══════════════════════════════════════════════════════════════
 # MODELO: Product
@@ -41,6 +50,7 @@ class Product(models.Model):
         price      — Precio en USD (INTEGER)
         created_at — Fecha de creación (se rellena automáticamente)
         updated_at — Fecha de última actualización (se actualiza sola)
+        comment_count — Nº de comentarios (desnormalizado, ver comments.py)
     """
 
     name = models.CharField(
@@ -70,6 +80,15 @@ class Product(models.Model):
         verbose_name='Actualizado el',
     )
 
+    # Mantenido por products/comments.py; evita COUNT(*) en la página de detalle
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Comentarios',
+    )
+
+    objects = ProductManager()
+
     class Meta:
         # Orden por defecto: más reciente primero
         ordering = ['-created_at']
@@ -83,6 +102,31 @@ class Product(models.Model):
         """
         return f'{self.name} (${self.price})'
 
+    def save(self, *args, **kwargs):
+        """
+        Con sharding activo el id se reserva ANTES del INSERT
+        (ids únicos entre shards) y la fila se escribe siempre en
+        el shard que le corresponde, aunque el llamante pase `using`.
+        El evento del outbox se escribe en la misma transacción.
+
+        Al actualizar no se escribe comment_count: lo mantienen
+        products/comments.py con UPDATE ... F() y el valor en memoria
+        suele estar desfasado (p. ej. llegaron comentarios después de
+        cargar el producto).
+        """
+        if sharding.is_enabled():
+            if self.pk is None:
+                self.pk = sharding.allocate_id(Product)
+                kwargs['force_insert'] = True
+            kwargs['using'] = sharding.alias_for(self.pk)
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comment_count' and field.attname not in deferred
+            ]
+        changes.save_and_record(self, super().save, *args, **kwargs)
+
 
 # ══════════════════════════════════════════════════════════════
 # MODELO: Comment
@@ -119,10 +163,184 @@ class Comment(models.Model):
         verbose_name='Publicado el',
     )
 
+    objects = CommentManager()
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Comentario'
         verbose_name_plural = 'Comentarios'
+        indexes = [
+            # Página de comentarios más recientes de un producto (keyset)
+            models.Index(fields=['product', '-created_at', '-id'], name='products_comment_recent_idx'),
+        ]
 
     def __str__(self):
         return f'Comentario en "{self.product.name}"'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Producto al cargar: si save() lo cambia, el contador se mueve (products/comments.py)
+        instance._saved_product_id = instance.__dict__.get('product_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Co-localización: el comentario se guarda en el shard de su producto.
+        if sharding.is_enabled():
+            if self.pk is None:
+                self.pk = sharding.allocate_id(Comment)
+                kwargs['force_insert'] = True
+            kwargs['using'] = sharding.alias_for(self.product_id)
+        changes.save_and_record(self, super().save, *args, **kwargs)
+
+
+# ══════════════════════════════════════════════════════════════
+# MODELOS DE SHARDING (viven sólo en la BBDD 'default')
+# Tablas SQL generadas: products_shardbucket, products_shardsequence
+# ══════════════════════════════════════════════════════════════
+
+class ShardBucket(models.Model):
+    """
+    Sobrescribe a qué shard pertenece un bucket (product.id % N).
+    Los buckets sin fila usan el reparto por rangos por defecto.
+    """
+
+    bucket = models.PositiveIntegerField(primary_key=True)
+    alias = models.CharField(max_length=50)
+    moved_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['bucket']
+
+    def __str__(self):
+        return f'bucket {self.bucket} → {self.alias}'
+
+
+class ShardSequence(models.Model):
+    """Siguiente id libre por modelo (p. ej. 'products.product')."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.name}: {self.next_value}'
+
+
+# ══════════════════════════════════════════════════════════════
+# OUTBOX DE CAMBIOS (CDC)
+# Tablas SQL generadas: products_changeevent, products_changeconsumer
+# ══════════════════════════════════════════════════════════════
+
+class ChangeEvent(models.Model):
+    """
+    Una fila por INSERT / UPDATE / DELETE de Product o Comment.
+    `seq` crece siempre: los consumidores leen "seq > último leído".
+    Con sharding existe una tabla por shard.
+    """
+
+    OPERATIONS = [
+        (changes.CREATE, 'Creado'),
+        (changes.UPDATE, 'Actualizado'),
+        (changes.DELETE, 'Eliminado'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['seq']
+
+    def __str__(self):
+        return f'#{self.seq} {self.operation} {self.model}:{self.object_id}'
+
+
+class ChangeConsumer(models.Model):
+    """Última posición (token) leída por cada consumidor del outbox."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    position = models.CharField(max_length=255, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} @ {self.position or "inicio"}'
+
+
+# ══════════════════════════════════════════════════════════════
+# ÍNDICE DE CASI DUPLICADOS (viven sólo en la BBDD 'default')
+# Tablas SQL generadas: products_productsignature, products_productband
+# ══════════════════════════════════════════════════════════════
+
+class ProductSignature(models.Model):
+    """
+    Firma de un producto: hash del texto normalizado y MinHash.
+    product_id no es ForeignKey porque el producto puede vivir en otro shard.
+    """
+
+    product_id = models.BigIntegerField(primary_key=True)
+    content_hash = models.CharField(max_length=40, db_index=True)
+    minhash = models.BinaryField()
+
+    def __str__(self):
+        return f'firma de #{self.product_id}'
+
+
+class ProductBand(models.Model):
+    """Una fila por banda LSH: (band, bucket) → product_id."""
+
+    product_id = models.BigIntegerField(db_index=True)
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='products_band_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.product_id} banda {self.band}'
+
+
+# ══════════════════════════════════════════════════════════════
+# RECOMENDACIONES "COMPRADOS JUNTOS" (viven sólo en la BBDD 'default')
+# Tablas SQL generadas: products_cartevent, products_productpair
+# ══════════════════════════════════════════════════════════════
+
+class CartEvent(models.Model):
+    """Registro append-only: `product_id` se añadió al carrito `cart_id`."""
+
+    cart_id = models.CharField(max_length=32)
+    product_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # rebuild_related recorre los eventos agrupados por carrito
+            models.Index(fields=['cart_id', 'id'], name='products_cartevent_cart_idx'),
+        ]
+
+    def __str__(self):
+        return f'carrito {self.cart_id} → #{self.product_id}'
+
+
+class ProductPair(models.Model):
+    """Veces que `product_id` y `related_id` estuvieron en el mismo carrito."""
+
+    product_id = models.BigIntegerField()
+    related_id = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_id', 'related_id'], name='products_pair_unique'),
+        ]
+        indexes = [
+            # top-k relacionados: WHERE product_id=? ORDER BY count DESC
+            models.Index(fields=['product_id', '-count'], name='products_pair_top_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.product_id} ↔ #{self.related_id} ({self.count})'
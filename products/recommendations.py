@@ -0,0 +1,216 @@
+"""
+products/recommendations.py
+===========================
+"FRECUENTEMENTE COMPRADOS JUNTOS" — Co-ocurrencias en el carrito
+─────────────────────────────────────────────────────────────────
+Cada vez que CartView.post añade un producto se guarda un CartEvent
+(carrito, producto). Dos productos del mismo carrito forman un par:
+
+  ProductPair(product_id, related_id, count)
+
+La tabla es dispersa (sólo pares que existen) y tiene un índice
+(product_id, -count), así que ProductShowView obtiene sus top-k
+relacionados con UNA consulta indexada, sin calcular nada.
+
+Actualización:
+  - Incremental (settings.RELATED_PRODUCTS_INCREMENTAL): al añadir P a
+    un carrito con Q1..Qk se suma 1 a (P,Qi) y (Qi,P): un INSERT y dos
+    UPDATE (uno por lado) por cada PAIR_BATCH_SIZE productos. Igual que
+    en rebuild(), un carrito con más de MAX_CART_SIZE productos ya no
+    suma pares (sólo se guarda el CartEvent).
+  - Por lotes: python manage.py rebuild_related recalcula todo desde
+    CartEvent con memoria acotada y deja sólo los top RELATED_KEEP
+    pares por producto (tabla compacta).
+
+Memoria de rebuild(): los eventos se leen en streaming ordenados por
+(cart_id, id), un carrito cada vez. Los contadores se reparten en
+particiones por product_id % P; cada pasada sólo guarda los pares
+cuyo producto cae en su partición. Si una pasada supera max_pairs se
+duplica P y se vuelve a empezar, hasta MAX_PARTITIONS: duplicar P no
+reparte los pares de UN producto muy popular, así que con P al máximo
+la pasada ya no se reinicia sino que poda, conservando los max_pairs/2
+pares más frecuentes (los contadores podados son aproximados, pero el
+top-k de cada producto sobrevive). Cada partición se sustituye en una
+transacción, así que un producto nunca queda con la lista a medias.
+─────────────────────────────────────────────────────────────────
+"""
+
+import heapq
+import itertools
+import operator
+from collections import Counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.db.models.functions import Mod
+
+# Pares que conserva la reconstrucción por lotes para cada producto
+RELATED_KEEP = 20
+# Pares distintos que una pasada de rebuild() puede tener en memoria
+MAX_PAIRS_IN_MEMORY = 2_000_000
+# Tope de particiones; al alcanzarlo rebuild() poda en vez de reiniciar
+MAX_PARTITIONS = 16
+# Carritos con más productos se ignoran en rebuild() (coste cuadrático; bots)
+MAX_CART_SIZE = 50
+# Filas leídas por viaje a la BBDD
+EVENT_CHUNK_SIZE = 10_000
+# Productos por INSERT/UPDATE en increment_pairs (límite de parámetros de SQLite)
+PAIR_BATCH_SIZE = 250
+
+
+def record_cart_add(cart_id, product_id, cart_product_ids):
+    """
+    Registra que `product_id` se añadió al carrito `cart_id`, que ya
+    contenía `cart_product_ids`. Los pares sólo se suman mientras el
+    carrito no pase de MAX_CART_SIZE productos (los mismos que cuenta
+    rebuild()).
+    """
+    from .models import CartEvent
+
+    others = {int(pk) for pk in cart_product_ids if str(pk).isdigit()} - {product_id}
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        CartEvent.objects.using(DEFAULT_DB_ALIAS).create(cart_id=cart_id, product_id=product_id)
+        if (
+            others
+            and len(others) < MAX_CART_SIZE
+            and getattr(settings, 'RELATED_PRODUCTS_INCREMENTAL', True)
+        ):
+            increment_pairs(product_id, others)
+
+
+def increment_pairs(product_id, others, batch_size=PAIR_BATCH_SIZE):
+    """Suma 1 a (product_id, o) y (o, product_id) para cada o en `others`."""
+    from .models import ProductPair
+
+    others = sorted(others)
+    pair_rows = ProductPair.objects.using(DEFAULT_DB_ALIAS)
+    for start in range(0, len(others), batch_size):
+        batch = others[start:start + batch_size]
+        # 1) crea los pares que falten con count=0 (sin carreras: ignore_conflicts)
+        pair_rows.bulk_create(
+            [ProductPair(product_id=product_id, related_id=other, count=0) for other in batch]
+            + [ProductPair(product_id=other, related_id=product_id, count=0) for other in batch],
+            ignore_conflicts=True,
+        )
+        # 2) un UPDATE por lado con IN (...): el WHERE no crece con el carrito
+        pair_rows.filter(product_id=product_id, related_id__in=batch).update(count=F('count') + 1)
+        pair_rows.filter(product_id__in=batch, related_id=product_id).update(count=F('count') + 1)
+
+
+def related_ids(product_id, k=4):
+    """Top-k ids relacionados: SELECT ... WHERE product_id=? ORDER BY count DESC LIMIT k."""
+    from .models import ProductPair
+
+    return list(
+        ProductPair.objects.using(DEFAULT_DB_ALIAS)
+        .filter(product_id=product_id)
+        .order_by('-count', 'related_id')
+        .values_list('related_id', flat=True)[:k]
+    )
+
+
+def related_products(product_id, k=4):
+    """Productos relacionados en orden de afinidad (los borrados se omiten)."""
+    from .models import Product
+
+    ids = related_ids(product_id, k)
+    found = Product.objects.in_bulk_across_shards(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+# ── Reconstrucción por lotes ─────────────────────────────────────
+
+def iter_carts(chunk_size=EVENT_CHUNK_SIZE):
+    """Productos distintos de cada carrito, leyendo CartEvent en streaming."""
+    from .models import CartEvent
+
+    rows = (
+        CartEvent.objects.using(DEFAULT_DB_ALIAS)
+        .order_by('cart_id', 'id')
+        .values_list('cart_id', 'product_id')
+        .iterator(chunk_size=chunk_size)
+    )
+    for _, events in itertools.groupby(rows, key=operator.itemgetter(0)):
+        yield {product_id for _, product_id in events}
+
+
+def count_partition(part, partitions, max_pairs, chunk_size=EVENT_CHUNK_SIZE, prune=False):
+    """
+    Cuenta los pares (a, b) con a % partitions == part.
+    Devuelve (counts, carritos, podados). Si no cabe en max_pairs:
+    con prune=True se quedan los max_pairs // 2 pares más frecuentes y
+    se sigue; si no, devuelve counts=None.
+    """
+    counts = Counter()
+    carts = pruned = 0
+    for products in iter_carts(chunk_size):
+        if len(products) < 2 or len(products) > MAX_CART_SIZE:
+            continue
+        carts += 1
+        for a in products:
+            if a % partitions != part:
+                continue
+            for b in products:
+                if b != a:
+                    counts[(a, b)] += 1
+        if len(counts) > max_pairs:
+            if not prune:
+                return None, carts, pruned
+            pruned += len(counts)
+            counts = Counter(dict(heapq.nlargest(max_pairs // 2, counts.items(), key=operator.itemgetter(1))))
+            pruned -= len(counts)
+    return counts, carts, pruned
+
+
+def replace_partition(counts, part, partitions, keep=RELATED_KEEP, min_count=1, batch_size=1000):
+    """Sustituye los pares de la partición por los top-`keep` de `counts`."""
+    from .models import ProductPair
+
+    ranked = sorted(
+        ((a, b, n) for (a, b), n in counts.items() if n >= min_count),
+        key=lambda row: (row[0], -row[2], row[1]),
+    )
+    rows = [
+        ProductPair(product_id=a, related_id=b, count=n)
+        for _, group in itertools.groupby(ranked, key=operator.itemgetter(0))
+        for a, b, n in itertools.islice(group, keep)
+    ]
+    pair_rows = ProductPair.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        pair_rows.alias(part=Mod('product_id', partitions)).filter(part=part).delete()
+        pair_rows.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def rebuild(partitions=1, keep=RELATED_KEEP, min_count=1,
+            max_pairs=MAX_PAIRS_IN_MEMORY, chunk_size=EVENT_CHUNK_SIZE):
+    """
+    Recalcula ProductPair desde CartEvent. Es un generador: produce un
+    dict por pasada (o {'restart': P} si hubo que aumentar particiones).
+    """
+    # Un carrito aporta hasta MAX_CART_SIZE - 1 pares por producto
+    if max_pairs < MAX_CART_SIZE - 1:
+        raise ValueError(f'max_pairs debe ser al menos {MAX_CART_SIZE - 1}')
+    partitions = min(partitions, MAX_PARTITIONS)
+
+    part = 0
+    while part < partitions:
+        counts, carts, pruned = count_partition(
+            part, partitions, max_pairs, chunk_size, prune=partitions >= MAX_PARTITIONS,
+        )
+        if counts is None:
+            partitions = min(partitions * 2, MAX_PARTITIONS)
+            part = 0
+            yield {'restart': partitions}
+            continue
+        written = replace_partition(counts, part, partitions, keep=keep, min_count=min_count)
+        yield {
+            'part': part,
+            'partitions': partitions,
+            'carts': carts,
+            'pairs': len(counts),
+            'pruned': pruned,
+            'written': written,
+        }
+        part += 1
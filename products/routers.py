@@ -0,0 +1,84 @@
+"""
+products/routers.py
+===================
+DATABASE ROUTER — Enrutado de Product/Comment a su shard
+─────────────────────────────────────────────────────────────────
+Django consulta a los routers (settings.DATABASE_ROUTERS) para saber
+en qué alias leer, escribir y migrar cada modelo.
+
+  - Product  → shard calculado a partir de su id.
+  - Comment  → shard de su producto (co-localización).
+  - ChangeEvent → existe en todos los shards; se escribe siempre con
+    .using(alias) explícito (ver products/changes.py).
+  - Resto    → None (Django usa 'default').
+
+Los accesos por relación (product.comments.all()) llegan con la
+instancia del producto en `hints`, así que se resuelven solos.
+Para consultas sin instancia usa Product.objects.for_id(pk) o
+Product.objects.across_shards(...): una lectura o escritura de
+Product/Comment sin shard lanza sharding.UnroutedQueryError (si no,
+iría a 'default', que con sharding activo está vacío: las lecturas
+devolverían nada y los UPDATE/DELETE no tocarían ninguna fila).
+save(), delete() de una instancia, Manager.create() y bulk_create()
+calculan el shard ellos mismos; dentro de sharding.pinned(alias) las
+consultas sin instancia van a `alias` (lo usa el admin).
+─────────────────────────────────────────────────────────────────
+"""
+
+from django.db import DEFAULT_DB_ALIAS
+
+from . import sharding
+
+# El outbox (ChangeEvent) vive junto a los datos para compartir transacción
+SHARDED_MODELS = {'product', 'comment', 'changeevent'}
+
+# Modelos cuyo shard se deduce de la instancia (hints['instance'])
+ROUTED_BY_INSTANCE = {'products.product', 'products.comment'}
+
+
+class ProductShardRouter:
+
+    def _alias(self, model, **hints):
+        if not sharding.is_enabled():
+            return None
+        if model._meta.app_label != 'products':
+            return None
+        if model._meta.model_name not in SHARDED_MODELS:
+            # Metadatos del sharding (ShardBucket, ShardSequence...)
+            return DEFAULT_DB_ALIAS
+
+        instance = hints.get('instance')
+        if instance is None:
+            return sharding.pinned_alias()
+        if instance._meta.model_name not in ('product', 'comment'):
+            return None
+        return sharding.alias_for_instance(instance)
+
+    def _routed_alias(self, operation, model, **hints):
+        alias = self._alias(model, **hints)
+        if alias is None and sharding.is_enabled() and model._meta.label_lower in ROUTED_BY_INSTANCE:
+            raise sharding.UnroutedQueryError(
+                f'{operation} de {model._meta.label} sin shard: usa .using(alias), '
+                'Product.objects.for_id(pk) o Product.objects.across_shards().'
+            )
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self._routed_alias('Lectura', model, **hints)
+
+    def db_for_write(self, model, **hints):
+        # Sin esto Django escribiría en 'default': Product.objects.filter(pk=…).delete()
+        # devolvería (0, {}) y la fila seguiría en su shard.
+        return self._routed_alias('Escritura', model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = set(sharding.shard_aliases()) | {DEFAULT_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in sharding.shard_aliases():
+            return None
+        # Los shards sólo contienen las tablas particionadas.
+        return app_label == 'products' and model_name in SHARDED_MODELS
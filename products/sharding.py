@@ -0,0 +1,281 @@
+"""
+products/sharding.py
+====================
+SHARDING HORIZONTAL — Product y Comment en varias BBDD SQLite
+─────────────────────────────────────────────────────────────────
+Un único db.sqlite3 sólo admite un escritor a la vez. Para repartir
+la carga, Product y Comment se distribuyen en N alias de base de
+datos (settings.PRODUCT_SHARDS → shard_0, shard_1, ...).
+
+Esquema de particionado:
+  bucket = product.id % PRODUCT_SHARD_BUCKETS   (hash → bucket virtual)
+  alias  = mapa[bucket]                         (rango de buckets → shard)
+
+  - Por defecto los buckets se asignan en rangos contiguos:
+      64 buckets / 2 shards → 0..31 → shard_0, 32..63 → shard_1
+  - El mapa puede sobrescribirse en la tabla ShardBucket (en 'default');
+    así el comando rebalance_shards mueve rangos de buckets en caliente.
+  - Los comentarios viven SIEMPRE en el shard de su producto.
+  - Los ids se reservan en bloques desde ShardSequence (en 'default'),
+    de modo que nunca colisionan entre shards.
+
+Si PRODUCT_SHARDS está vacío el sharding queda desactivado y todo
+funciona como antes sobre 'default'. Al activarlo sobre una BBDD con
+datos, python manage.py shard_default_data los reparte entre shards.
+
+Con sharding activo, leer o escribir Product/Comment sin indicar el
+shard (p. ej. Product.objects.get(pk=1) o .filter(pk=1).delete())
+lanza UnroutedQueryError en lugar de usar 'default', que está vacío.
+─────────────────────────────────────────────────────────────────
+"""
+
+import base64
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, F, Max, Q, Value, When
+
+
+class UnroutedQueryError(RuntimeError):
+    """Lectura o escritura de Product/Comment sin shard conocido con el sharding activo."""
+
+
+# ── Configuración ────────────────────────────────────────────────
+
+def shard_aliases():
+    """Alias de BBDD que contienen productos (['default'] sin sharding)."""
+    return list(getattr(settings, 'PRODUCT_SHARDS', [])) or [DEFAULT_DB_ALIAS]
+
+
+def is_enabled():
+    return bool(getattr(settings, 'PRODUCT_SHARDS', []))
+
+
+def bucket_count():
+    return getattr(settings, 'PRODUCT_SHARD_BUCKETS', 64)
+
+
+def bucket_for(pk):
+    return int(pk) % bucket_count()
+
+
+# ── Mapa bucket → alias (cacheado por proceso) ───────────────────
+
+_map_lock = threading.Lock()
+_map_cache = {'expires': 0.0, 'map': None}
+
+
+def default_map():
+    """Reparte los buckets en rangos contiguos entre los shards."""
+    aliases = shard_aliases()
+    buckets = bucket_count()
+    return {b: aliases[b * len(aliases) // buckets] for b in range(buckets)}
+
+
+def shard_map():
+    """
+    Devuelve {bucket: alias}. Se recarga desde ShardBucket cada
+    PRODUCT_SHARD_MAP_TTL segundos, por lo que un cambio hecho por
+    rebalance_shards tarda como mucho ese tiempo en propagarse.
+    """
+    if not is_enabled():
+        return default_map()
+
+    now = time.monotonic()
+    with _map_lock:
+        if _map_cache['map'] is not None and now < _map_cache['expires']:
+            return _map_cache['map']
+
+    from .models import ShardBucket
+
+    mapping = default_map()
+    overrides = ShardBucket.objects.using(DEFAULT_DB_ALIAS).values_list('bucket', 'alias')
+    mapping.update({bucket: alias for bucket, alias in overrides if alias in settings.DATABASES})
+
+    ttl = getattr(settings, 'PRODUCT_SHARD_MAP_TTL', 5)
+    with _map_lock:
+        _map_cache['map'] = mapping
+        _map_cache['expires'] = now + ttl
+    return mapping
+
+
+def invalidate_shard_map():
+    with _map_lock:
+        _map_cache['map'] = None
+
+
+def alias_for(pk):
+    """Alias del shard que guarda el producto `pk` (y sus comentarios)."""
+    if not is_enabled() or pk is None:
+        return DEFAULT_DB_ALIAS
+    return shard_map()[bucket_for(pk)]
+
+
+def alias_for_instance(instance):
+    """Shard de un Product (por su id) o de un Comment (por su producto)."""
+    if instance._meta.model_name == 'comment':
+        return alias_for(instance.product_id)
+    return alias_for(instance.pk)
+
+
+# ── Shard fijado para un bloque ──────────────────────────────────
+
+_pinned = threading.local()
+
+
+@contextmanager
+def pinned(alias):
+    """
+    Dentro del bloque, las consultas de Product/Comment sin instancia
+    van a `alias` en vez de lanzar UnroutedQueryError. Lo usa el admin,
+    que abre sus transacciones con router.db_for_write(model).
+    """
+    previous = getattr(_pinned, 'alias', None)
+    _pinned.alias = alias
+    try:
+        yield
+    finally:
+        _pinned.alias = previous
+
+
+def pinned_alias():
+    return getattr(_pinned, 'alias', None)
+
+
+# ── Reserva de ids globales ──────────────────────────────────────
+
+_id_lock = threading.Lock()
+_id_blocks = {}
+
+
+def _seed_value(model):
+    """
+    Primer id libre: el máximo existente en cualquier shard + 1.
+    Incluye 'default', que puede conservar filas de antes del sharding.
+    """
+    highest = 0
+    for alias in {DEFAULT_DB_ALIAS, *shard_aliases()}:
+        value = model._default_manager.using(alias).aggregate(m=Max('pk'))['m']
+        highest = max(highest, value or 0)
+    return highest + 1
+
+
+def allocate_id(model):
+    """
+    Reserva un id único entre shards para `model`.
+
+    Los ids se piden a ShardSequence en bloques de
+    PRODUCT_SHARD_ID_BLOCK para que la escritura en 'default'
+    no se convierta en el nuevo cuello de botella.
+    """
+    from .models import ShardSequence
+
+    name = model._meta.label_lower
+    with _id_lock:
+        current, limit = _id_blocks.get(name, (0, 0))
+        if current < limit:
+            _id_blocks[name] = (current + 1, limit)
+            return current
+
+        size = getattr(settings, 'PRODUCT_SHARD_ID_BLOCK', 100)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            sequences = ShardSequence.objects.using(DEFAULT_DB_ALIAS)
+            if not sequences.filter(name=name).update(next_value=F('next_value') + size):
+                sequences.create(name=name, next_value=_seed_value(model) + size)
+            end = sequences.get(name=name).next_value
+
+        start = end - size
+        _id_blocks[name] = (start + 1, end)
+        return start
+
+
+# ── Copia entre BBDD ─────────────────────────────────────────────
+
+def upsert_rows(model, objs, alias, fields):
+    """
+    UPSERT por id en `alias` conservando las fechas: bulk_create ejecuta
+    pre_save, que pisaría auto_now / auto_now_add con la hora de la copia.
+    """
+    dated = [
+        f for f in model._meta.concrete_fields
+        if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)
+    ]
+    original = {obj.pk: {f.attname: getattr(obj, f.attname) for f in dated} for obj in objs}
+    model.objects.using(alias).bulk_create(
+        objs, update_conflicts=True, unique_fields=['id'], update_fields=fields,
+    )
+    if not original or not dated:
+        return
+    model._base_manager.using(alias).filter(pk__in=original).update(**{
+        f.attname: Case(
+            *[When(pk=pk, then=Value(values[f.attname])) for pk, values in original.items()],
+            output_field=f,
+        )
+        for f in dated
+    })
+    for obj in objs:
+        for attname, value in original[obj.pk].items():
+            setattr(obj, attname, value)
+
+
+# ── Cursores keyset (-created_at, -id) ───────────────────────────
+
+def encode_cursor(obj):
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Devuelve (created_at, pk) o None si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def after_cursor(queryset, cursor):
+    """Filtra las filas que van DESPUÉS del cursor en orden descendente."""
+    position = decode_cursor(cursor)
+    if position is None:
+        return queryset
+    created_at, pk = position
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+
+# ── Scatter-gather ───────────────────────────────────────────────
+
+def scatter_gather(queryset, limit=None, cursor=None):
+    """
+    Ejecuta `queryset` en todos los shards y mezcla los resultados
+    respetando el orden (-created_at, -id).
+
+    Cada shard devuelve como mucho `limit` filas ya ordenadas, así que
+    la mezcla (heapq.merge) no necesita cargar más de N × limit filas.
+
+    Devuelve (objetos, next_cursor); next_cursor es None en la última página.
+    """
+    queryset = after_cursor(queryset, cursor).order_by('-created_at', '-pk')
+    fetch = None if limit is None else limit + 1
+
+    streams = []
+    for alias in shard_aliases():
+        shard_qs = queryset.using(alias)
+        streams.append(shard_qs[:fetch] if fetch else shard_qs)
+
+    merged = heapq.merge(*streams, key=lambda obj: (obj.created_at, obj.pk), reverse=True)
+    rows = list(itertools.islice(merged, fetch))
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
@@ -1,3 +1,974 @@
-from django.test import TestCase
+"""
+products/tests.py
+=================
+PRUEBAS DE LA APP PRODUCTS
+─────────────────────────────────────────────────────────────────
+  python manage.py test --settings=helloworld_project.settings_test
 
-# Create your tests here.
+settings_test añade dos BBDD de shard (shard_0, shard_1). Las clases
+marcadas con @two_shards activan el sharding con override_settings; el
+resto corre con la configuración de producción (sin shards). Las
+pruebas de vistas y comandos tienen una subclase Sharded... para
+ejecutarse en las dos configuraciones. Con settings normales las clases
+@two_shards se saltan.
+
+Con 64 buckets el producto con id 1..31 vive en shard_0 y el 32..63 en
+shard_1, así que las pruebas fijan los ids para elegir shard.
+─────────────────────────────────────────────────────────────────
+"""
+
+import itertools
+import json
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connections, transaction
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import changes, dedup, recommendations, sharding
+from .factories import CommentFactory, ProductFactory
+from .forms import ProductForm
+from .views import COMMENTS_PAGE_SIZE
+from .models import CartEvent, ChangeEvent, Comment, Product, ProductBand, ProductPair, ProductSignature, ShardBucket
+
+SHARD_0, SHARD_1 = 'shard_0', 'shard_1'
+SHARD_DATABASES = {SHARD_0, SHARD_1} <= set(settings.DATABASES)
+
+# Ids de ejemplo en cada shard (bucket = id % 64)
+ON_SHARD_0 = 5
+ON_SHARD_1 = 40
+
+
+def two_shards(cls):
+    """Ejecuta la clase con PRODUCT_SHARDS=[shard_0, shard_1]."""
+    cls = override_settings(PRODUCT_SHARDS=[SHARD_0, SHARD_1])(cls)
+    return skipUnless(SHARD_DATABASES, 'requiere --settings=helloworld_project.settings_test')(cls)
+
+
+class ShardedTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        sharding.invalidate_shard_map()
+        sharding._id_blocks.clear()
+        self.addCleanup(sharding.invalidate_shard_map)
+        self.addCleanup(sharding._id_blocks.clear)
+
+    @contextmanager
+    def on_commit_callbacks(self):
+        """Ejecuta los transaction.on_commit de todas las BBDD, como en autocommit."""
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(self.captureOnCommitCallbacks(using=alias, execute=True))
+            yield
+
+    def make_product(self, pk=None, name='Producto', created_at=None, **fields):
+        product = Product(pk=pk, name=name, price=fields.pop('price', 100), **fields)
+        with self.on_commit_callbacks():
+            product.save()
+        if created_at is not None:
+            Product._base_manager.using(product._state.db).filter(pk=product.pk).update(created_at=created_at)
+            product.created_at = created_at
+        return product
+
+
+@two_shards
+class ShardRoutingTests(ShardedTestCase):
+
+    def test_product_lives_on_bucket_shard(self):
+        first = self.make_product(pk=ON_SHARD_0)
+        second = self.make_product(pk=ON_SHARD_1)
+
+        self.assertEqual(first._state.db, SHARD_0)
+        self.assertEqual(second._state.db, SHARD_1)
+        self.assertTrue(Product.objects.using(SHARD_1).filter(pk=ON_SHARD_1).exists())
+        self.assertFalse(Product.objects.using(SHARD_0).filter(pk=ON_SHARD_1).exists())
+
+    def test_comments_follow_their_product(self):
+        product = self.make_product(pk=ON_SHARD_1)
+        comment = Comment.objects.create(product=product, description='Hola')
+
+        self.assertEqual(comment._state.db, SHARD_1)
+        self.assertEqual(list(product.comments.all()), [comment])
+        self.assertEqual(list(Comment.objects.for_product(product.pk)), [comment])
+
+    def test_save_ignores_wrong_using(self):
+        product = Product(pk=ON_SHARD_1, name='Producto', price=1)
+        product.save(using=SHARD_0)
+
+        self.assertEqual(product._state.db, SHARD_1)
+
+    def test_unrouted_read_raises(self):
+        self.make_product(pk=ON_SHARD_0)
+
+        with self.assertRaises(sharding.UnroutedQueryError):
+            Product.objects.get(pk=ON_SHARD_0)
+        with self.assertRaises(sharding.UnroutedQueryError):
+            list(Comment.objects.filter(product_id=ON_SHARD_0))
+
+    def test_unrouted_write_raises_instead_of_hitting_default(self):
+        self.make_product(pk=ON_SHARD_0)
+
+        with self.assertRaises(sharding.UnroutedQueryError):
+            Product.objects.filter(pk=ON_SHARD_0).delete()
+        with self.assertRaises(sharding.UnroutedQueryError):
+            Product.objects.filter(pk=ON_SHARD_0).update(price=1)
+        with self.assertRaises(sharding.UnroutedQueryError):
+            Product.objects.update_or_create(pk=ON_SHARD_0, defaults={'price': 1})
+        self.assertEqual(Product.objects.for_id(ON_SHARD_0).get(pk=ON_SHARD_0).price, 100)
+
+    def test_manager_create_and_factories_pick_the_shard(self):
+        product = Product.objects.create(pk=ON_SHARD_1, name='Producto', price=1)
+        built = ProductFactory()
+        comment = CommentFactory(product=product)
+
+        self.assertEqual(product._state.db, SHARD_1)
+        self.assertEqual(built._state.db, sharding.alias_for(built.pk))
+        self.assertEqual(comment._state.db, SHARD_1)
+        self.assertTrue(Comment.objects.for_product(product.pk).filter(pk=comment.pk).exists())
+
+    def test_allocated_ids_are_unique_across_shards(self):
+        ids = [self.make_product().pk for _ in range(150)]
+
+        self.assertEqual(len(set(ids)), len(ids))
+        stored = sum(Product.objects.using(alias).count() for alias in (SHARD_0, SHARD_1))
+        self.assertEqual(stored, len(ids))
+
+    def test_id_seed_includes_default_rows(self):
+        # bulk_create no pasa por Product.save(), que lo llevaría a un shard
+        Product._base_manager.using('default').bulk_create([Product(pk=500, name='Antiguo', price=1)])
+
+        self.assertGreater(self.make_product().pk, 500)
+
+
+@two_shards
+class ScatterGatherTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Intercala shards y fuerza un empate de created_at (se ordena por -id)
+        self.products = [
+            self.make_product(pk=ON_SHARD_0, created_at=now),
+            self.make_product(pk=ON_SHARD_1, created_at=now),
+            self.make_product(pk=ON_SHARD_0 + 1, created_at=now - timedelta(minutes=1)),
+            self.make_product(pk=ON_SHARD_1 + 1, created_at=now - timedelta(minutes=2)),
+            self.make_product(pk=ON_SHARD_0 + 2, created_at=now - timedelta(minutes=3)),
+        ]
+        self.expected = [p.pk for p in sorted(self.products, key=lambda p: (p.created_at, p.pk), reverse=True)]
+
+    def test_merge_keeps_global_order(self):
+        rows, next_cursor = Product.objects.across_shards()
+
+        self.assertEqual([p.pk for p in rows], self.expected)
+        self.assertIsNone(next_cursor)
+
+    def test_keyset_pages_cover_everything_once(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = Product.objects.across_shards(limit=2, cursor=cursor)
+            seen += [p.pk for p in rows]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, self.expected)
+
+
+@two_shards
+@override_settings(PRODUCT_SHARD_MAP_TTL=0)
+class RebalanceTests(ShardedTestCase):
+
+    def rebalance(self, during_wait=None):
+        def wait(seconds):
+            if during_wait is not None:
+                # El comando corre con el outbox apagado; las escrituras
+                # "concurrentes" de usuarios sí deben dejar eventos.
+                with mock.patch.object(changes, 'is_suppressed', return_value=False):
+                    during_wait()
+
+        with mock.patch('products.management.commands.rebalance_shards.time') as fake_time:
+            fake_time.sleep.side_effect = wait
+            call_command('rebalance_shards', buckets='0-31', to=SHARD_1, grace=0, stdout=mock.Mock())
+        sharding.invalidate_shard_map()
+
+    def test_moves_products_comments_and_switches_map(self):
+        product = self.make_product(pk=ON_SHARD_0, created_at=timezone.now() - timedelta(days=1))
+        Comment.objects.create(product=product, description='Hola')
+
+        self.rebalance()
+
+        self.assertEqual(sharding.alias_for(ON_SHARD_0), SHARD_1)
+        self.assertEqual(ShardBucket.objects.get(bucket=ON_SHARD_0).alias, SHARD_1)
+        self.assertFalse(Product.objects.using(SHARD_0).exists())
+        moved = Product.objects.for_id(ON_SHARD_0).get(pk=ON_SHARD_0)
+        self.assertEqual(moved.created_at, product.created_at)
+        self.assertEqual(moved.comment_count, 1)
+        self.assertEqual(Comment.objects.for_product(ON_SHARD_0).count(), 1)
+
+    def test_sync_applies_source_changes_without_overwriting_target(self):
+        edited_twice = self.make_product(pk=1, name='Original')
+        deleted_on_source = self.make_product(pk=2)
+        edited_on_source = self.make_product(pk=3, price=1)
+        deleted_on_target = self.make_product(pk=4)
+        edited_then_deleted = self.make_product(pk=6)
+
+        def concurrent_writes():
+            source = Product.objects.using(SHARD_0)
+            # Un proceso con el mapa viejo escribe en el origen...
+            source.filter(pk=edited_twice.pk).update(name='Mapa viejo')
+            source.filter(pk=deleted_on_source.pk).delete()
+            source.filter(pk=edited_on_source.pk).update(price=99)
+            source.filter(pk=edited_then_deleted.pk).update(price=7)
+            # ...y luego otro, con el mapa nuevo, en el destino
+            sharding.invalidate_shard_map()
+            newer = Product.objects.for_id(edited_twice.pk).get(pk=edited_twice.pk)
+            newer.name = 'Mapa nuevo'
+            newer.save()
+            Product.objects.for_id(deleted_on_target.pk).filter(pk=deleted_on_target.pk).delete()
+            Product.objects.for_id(edited_then_deleted.pk).filter(pk=edited_then_deleted.pk).delete()
+
+        self.rebalance(during_wait=concurrent_writes)
+
+        target = Product.objects.using(SHARD_1)
+        self.assertEqual(target.get(pk=edited_twice.pk).name, 'Mapa nuevo')
+        self.assertFalse(target.filter(pk=deleted_on_source.pk).exists())
+        self.assertEqual(target.get(pk=edited_on_source.pk).price, 99)
+        self.assertFalse(target.filter(pk=deleted_on_target.pk).exists())
+        self.assertFalse(target.filter(pk=edited_then_deleted.pk).exists())
+        self.assertFalse(Product.objects.using(SHARD_0).exists())
+
+
+@two_shards
+class ShardDefaultDataTests(ShardedTestCase):
+
+    def test_moves_default_rows_to_their_shard(self):
+        with override_settings(PRODUCT_SHARDS=[]):
+            first = self.make_product(name='Antes del sharding')
+            second = self.make_product(pk=ON_SHARD_1, name='También antes')
+            Comment.objects.create(product=second, description='Hola')
+        self.assertEqual(first._state.db, 'default')
+
+        call_command('shard_default_data', stdout=mock.Mock())
+
+        self.assertFalse(Product.objects.using('default').exists())
+        self.assertFalse(Comment.objects.using('default').exists())
+        self.assertEqual(Product.objects.for_id(first.pk).get(pk=first.pk).name, 'Antes del sharding')
+        self.assertEqual(Comment.objects.for_product(second.pk).count(), 1)
+        self.assertGreater(self.make_product().pk, ON_SHARD_1)
+
+
+@two_shards
+class ChangeOutboxTests(ShardedTestCase):
+
+    def events(self, alias):
+        return list(ChangeEvent.objects.using(alias).values_list('model', 'object_id', 'operation'))
+
+    def test_save_and_delete_write_events_on_the_product_shard(self):
+        product = self.make_product(pk=ON_SHARD_1)
+        product.name = 'Renombrado'
+        product.save()
+        comment = Comment.objects.create(product=product, description='Hola')
+        product.delete()
+
+        self.assertEqual(self.events(SHARD_0), [])
+        self.assertEqual(self.events(SHARD_1), [
+            ('products.product', ON_SHARD_1, changes.CREATE),
+            ('products.product', ON_SHARD_1, changes.UPDATE),
+            ('products.comment', comment.pk, changes.CREATE),
+            ('products.comment', comment.pk, changes.DELETE),
+            ('products.product', ON_SHARD_1, changes.DELETE),
+        ])
+
+    def test_event_and_row_commit_together(self):
+        # Si falla el INSERT del evento tampoco se guarda el producto...
+        with mock.patch.object(ChangeEvent.objects, 'using', side_effect=RuntimeError('outbox caído')):
+            with self.assertRaises(RuntimeError):
+                self.make_product(pk=ON_SHARD_0)
+        self.assertFalse(Product.objects.using(SHARD_0).exists())
+
+        # ...y si la transacción hace rollback desaparecen los dos
+        with self.assertRaises(ValueError):
+            with transaction.atomic(using=SHARD_0):
+                self.make_product(pk=ON_SHARD_0)
+                raise ValueError
+        self.assertFalse(Product.objects.using(SHARD_0).exists())
+        self.assertEqual(self.events(SHARD_0), [])
+
+    def test_bulk_paths_are_recorded(self):
+        created = Product.objects.bulk_create([Product(name=f'P{i}', price=i) for i in range(3)])
+        Product.objects.using(created[0]._state.db).filter(pk=created[0].pk).update(price=500)
+
+        operations = [op for alias in (SHARD_0, SHARD_1) for _, _, op in self.events(alias)]
+        self.assertEqual(operations.count(changes.CREATE), 3)
+        self.assertEqual(operations.count(changes.UPDATE), 1)
+
+    def test_suppressed_writes_nothing(self):
+        with changes.suppressed():
+            self.make_product(pk=ON_SHARD_0).delete()
+
+        self.assertEqual(self.events(SHARD_0), [])
+
+    def test_feed_token_resumes_across_shards(self):
+        for pk in (ON_SHARD_0, ON_SHARD_1, ON_SHARD_0 + 1, ON_SHARD_1 + 1):
+            self.make_product(pk=pk)
+
+        first, token = changes.read_changes(limit=3)
+        rest, final = changes.read_changes(since=token, limit=10)
+        empty, same = changes.read_changes(since=final)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(
+            sorted(event.object_id for event in first + rest),
+            [ON_SHARD_0, ON_SHARD_0 + 1, ON_SHARD_1, ON_SHARD_1 + 1],
+        )
+        self.assertEqual(empty, [])
+        self.assertEqual(same, final)
+
+
+class ChangeFeedTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.products = [self.make_product(pk=pk) for pk in (ON_SHARD_0, ON_SHARD_1, ON_SHARD_0 + 1)]
+        self.token = changes.make_consumer_token('search')
+
+    def feed(self, token=None, **params):
+        headers = {'HTTP_X_CHANGES_TOKEN': token or self.token}
+        return self.client.get(reverse('products:changes'), params, **headers)
+
+    def object_ids(self, response):
+        return sorted(change['object_id'] for change in response.json()['changes'])
+
+    def remaining_events(self):
+        return sum(ChangeEvent.objects.using(alias).count() for alias in sharding.shard_aliases())
+
+    def tail(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('tail_changes', *args, stdout=out, stderr=err)
+        return [json.loads(line)['object_id'] for line in out.getvalue().splitlines()]
+
+    def test_feed_requires_staff_or_a_valid_token(self):
+        url = reverse('products:changes')
+        expired_at = time.time() - settings.CHANGES_TOKEN_MAX_AGE - 60
+        with mock.patch('django.core.signing.time.time', return_value=expired_at):
+            expired = changes.make_consumer_token('search')
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+        for token in (self.token + 'x', 'search', expired):
+            with self.subTest(token=token):
+                self.assertEqual(self.client.get(url, HTTP_X_CHANGES_TOKEN=token).status_code, 403)
+        self.assertEqual(self.feed().status_code, 200)
+
+        self.client.force_login(User.objects.create_user('cliente', password='secreto'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', password='secreto', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_changes_token_command_prints_a_valid_token(self):
+        out = StringIO()
+        call_command('changes_token', '--consumer', 'search', stdout=out, stderr=StringIO())
+
+        self.assertEqual(changes.read_consumer_token(out.getvalue().strip()), 'search')
+
+    def test_limit_is_clamped(self):
+        ids = sorted(product.pk for product in self.products)
+
+        self.assertEqual(len(self.feed(limit=0).json()['changes']), 1)
+        self.assertEqual(self.object_ids(self.feed(limit='muchos')), ids)
+        with mock.patch('products.views.CHANGES_MAX_LIMIT', 2):
+            page = self.feed(limit=5000).json()
+        self.assertEqual(len(page['changes']), 2)
+        self.assertTrue(page['has_more'])
+
+    def test_invalid_since_reads_from_the_start(self):
+        ids = sorted(product.pk for product in self.products)
+        for since in ('basura', '-5.-5', '.'):
+            with self.subTest(since=since):
+                self.assertEqual(self.object_ids(self.feed(since=since)), ids)
+
+    def test_next_token_resumes_the_feed(self):
+        first = self.feed(limit=2).json()
+        rest = self.feed(since=first['next']).json()
+
+        self.assertEqual(
+            sorted(change['object_id'] for change in first['changes'] + rest['changes']),
+            sorted(product.pk for product in self.products),
+        )
+        self.assertFalse(rest['has_more'])
+
+    def test_tail_changes_saves_and_resumes_the_checkpoint(self):
+        self.assertEqual(sorted(self.tail('--consumer', 'search', '--batch-size', '2')),
+                         sorted(product.pk for product in self.products))
+        checkpoint = changes.get_checkpoint('search')
+        self.assertEqual(self.tail('--since', checkpoint), [])
+
+        new = self.make_product(pk=ON_SHARD_1 + 1)
+
+        self.assertEqual(self.tail('--consumer', 'search'), [new.pk])
+        self.assertNotEqual(changes.get_checkpoint('search'), checkpoint)
+
+    def test_compaction_keeps_events_a_consumer_has_not_read(self):
+        old = timezone.now() - timedelta(days=30)
+        for alias in sharding.shard_aliases():
+            ChangeEvent.objects.using(alias).update(created_at=old)
+        self.tail('--consumer', 'search')
+        _, partial = changes.read_changes(limit=1)
+        changes.save_checkpoint('audit', partial)
+
+        call_command('compact_changes', '--days', '7', stdout=StringIO())
+        self.assertEqual(self.remaining_events(), 2)
+
+        changes.save_checkpoint('audit', changes.get_checkpoint('search'))
+        self.make_product(pk=ON_SHARD_1 + 1)  # reciente: --days lo conserva
+        call_command('compact_changes', '--days', '7', stdout=StringIO())
+        self.assertEqual(self.remaining_events(), 1)
+
+
+@two_shards
+class ShardedChangeFeedTests(ChangeFeedTests):
+    pass
+
+
+class DuplicateFormTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.make_product(name='iPhone 14 Pro', description='Smartphone Apple 128 GB')
+
+    def form(self, name, description='Smartphone Apple 128 GB', **extra):
+        return ProductForm({'name': name, 'price': 999, 'description': description, **extra})
+
+    def test_exact_duplicate_is_rejected_even_if_confirmed(self):
+        form = self.form('IPHONE 14 PRO', confirm_duplicate='on')
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('mismo nombre', form.non_field_errors()[0])
+
+    def test_similar_product_asks_for_confirmation(self):
+        form = self.form('iPhone 15 Pro')
+
+        self.assertFalse(form.is_valid())
+        self.assertTrue(form.similar_found)
+
+        confirmed = self.form('iPhone 15 Pro', confirm_duplicate='on')
+        self.assertTrue(confirmed.is_valid(), confirmed.errors)
+
+    def test_create_view_shows_the_checkbox(self):
+        response = self.client.post(reverse('products:create'), {
+            'name': 'iPhone 15 Pro', 'price': 999, 'description': 'Smartphone Apple 128 GB',
+        })
+
+        self.assertContains(response, 'name="confirm_duplicate"')
+
+
+@two_shards
+class ShardedDuplicateFormTests(DuplicateFormTests):
+    pass
+
+
+class DuplicateIndexTests(ShardedTestCase):
+
+    def test_rolled_back_save_leaves_the_index_alone(self):
+        product = self.make_product(pk=ON_SHARD_0, name='Teclado mecánico')
+
+        with self.on_commit_callbacks():
+            with self.assertRaises(RuntimeError), transaction.atomic(using=product._state.db):
+                Product.objects.for_id(product.pk).filter(pk=product.pk).update(name='Ratón inalámbrico')
+                raise RuntimeError
+        self.assertEqual(dedup.exact_duplicate('Teclado mecánico'), product.pk)
+        self.assertIsNone(dedup.exact_duplicate('Ratón inalámbrico'))
+
+        with self.on_commit_callbacks():
+            Product.objects.for_id(product.pk).filter(pk=product.pk).update(name='Ratón inalámbrico')
+        self.assertEqual(dedup.exact_duplicate('Ratón inalámbrico'), product.pk)
+
+    def test_bulk_create_unique_skips_catalog_and_batch_duplicates(self):
+        self.make_product(name='Teclado mecánico')
+        batch = [Product(name=name, price=100) for name in ['Teclado  MECÁNICO', 'Ratón', 'ratón!']]
+
+        with self.on_commit_callbacks():
+            created, skipped = Product.objects.bulk_create_unique(batch)
+
+        self.assertEqual([p.name for p in created], ['Ratón'])
+        self.assertEqual(len(skipped), 2)
+        self.assertIsNotNone(dedup.exact_duplicate('Ratón'))
+
+
+@two_shards
+class ShardedDuplicateIndexTests(DuplicateIndexTests):
+    pass
+
+
+class ClusterRebuildTests(ShardedTestCase):
+
+    def test_rebuild_replaces_in_place_and_drops_orphans(self):
+        kept = self.make_product(pk=ON_SHARD_0, name='Teclado mecánico')
+        gone = self.make_product(pk=ON_SHARD_1, name='Ratón inalámbrico')
+        with changes.suppressed():
+            Product._base_manager.using(gone._state.db).filter(pk=gone.pk).delete()
+
+        with mock.patch.object(dedup, 'unindex_products', wraps=dedup.unindex_products) as unindex:
+            call_command('cluster_duplicates', '--rebuild', stdout=StringIO())
+
+        # Sólo se borra lo huérfano, nunca el índice entero
+        unindex.assert_called_once_with([gone.pk])
+        indexed = ProductSignature.objects.values_list('product_id', flat=True)
+        self.assertEqual(list(indexed), [kept.pk])
+        self.assertEqual(ProductBand.objects.filter(product_id=kept.pk).count(), dedup.BANDS)
+
+
+@two_shards
+class ShardedClusterRebuildTests(ClusterRebuildTests):
+    pass
+
+
+class RebuildRelatedTests(TestCase):
+    databases = '__all__'
+
+    def test_popular_product_with_more_partners_than_max_pairs_finishes(self):
+        # El producto 1 está en todos los carritos, siempre con el 2
+        events = []
+        for cart in range(20):
+            partners = [2] + [100 + cart * 5 + i for i in range(4)]
+            events += [CartEvent(cart_id=f'c{cart}', product_id=pk) for pk in [1, *partners]]
+        CartEvent.objects.bulk_create(events)
+        max_pairs = recommendations.MAX_CART_SIZE - 1
+
+        steps = list(itertools.islice(recommendations.rebuild(max_pairs=max_pairs, keep=3), 100))
+
+        self.assertLess(len(steps), 100)
+        self.assertEqual(steps[-1]['partitions'], recommendations.MAX_PARTITIONS)
+        self.assertTrue(any(step.get('pruned') for step in steps))
+        self.assertEqual(recommendations.related_ids(1, k=1), [2])
+        self.assertEqual(ProductPair.objects.get(product_id=1, related_id=2).count, 20)
+
+    def test_max_pairs_below_one_cart_is_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_related', '--max-pairs', '10', stdout=StringIO())
+
+
+class CartRelatedTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.make_product(pk=ON_SHARD_0, name='Teclado mecánico')
+        self.second = self.make_product(pk=ON_SHARD_1, name='Reposamuñecas')
+
+    def add_to_cart(self, product):
+        return self.client.post(reverse('pages:cart_add', args=[product.pk]))
+
+    def test_adding_two_products_feeds_the_related_block(self):
+        self.assertRedirects(self.add_to_cart(self.first), reverse('pages:cart_index'))
+        self.add_to_cart(self.second)
+        self.add_to_cart(self.second)  # repetido: no cuenta otra vez
+
+        self.assertEqual(
+            sorted(CartEvent.objects.values_list('product_id', flat=True)),
+            [self.first.pk, self.second.pk],
+        )
+        self.assertEqual(
+            sorted(ProductPair.objects.values_list('product_id', 'related_id', 'count')),
+            [(self.first.pk, self.second.pk, 1), (self.second.pk, self.first.pk, 1)],
+        )
+        response = self.client.get(reverse('products:show', args=[self.first.pk]))
+        self.assertContains(response, 'Frecuentemente comprados juntos')
+        self.assertContains(
+            response, f'<a href="{reverse("products:show", args=[self.second.pk])}">Reposamuñecas</a>', html=True,
+        )
+
+    def test_large_cart_still_records_the_event(self):
+        others = range(1000, 1000 + 600)
+
+        recommendations.record_cart_add('bot', self.first.pk, others)
+
+        self.assertEqual(CartEvent.objects.filter(cart_id='bot').count(), 1)
+        self.assertFalse(ProductPair.objects.exists())
+
+    def test_increment_pairs_batches_large_carts(self):
+        others = range(1000, 1000 + 600)
+
+        recommendations.increment_pairs(self.first.pk, others)
+        recommendations.increment_pairs(self.first.pk, others)
+
+        self.assertEqual(ProductPair.objects.count(), 2 * len(others))
+        self.assertEqual(set(ProductPair.objects.values_list('count', flat=True)), {2})
+
+
+@two_shards
+class ShardedCartRelatedTests(CartRelatedTests):
+    pass
+
+
+@skipUnless(settings.JINJA2_INSTALLED, 'requiere jinja2')
+class StorefrontTemplateTests(SimpleTestCase):
+
+    def test_jinja2_date_uses_the_current_time_zone(self):
+        value = datetime(2024, 1, 1, 3, 30, tzinfo=dt_timezone.utc)
+
+        with timezone.override('America/Santiago'):
+            django_output = engines['django'].from_string('{{ value|date:"Y-m-d H:i" }}').render({'value': value})
+            jinja2_output = engines['jinja2'].from_string('{{ value|date("Y-m-d H:i") }}').render({'value': value})
+
+        self.assertEqual(django_output, '2024-01-01 00:30')
+        self.assertEqual(jinja2_output, django_output)
+
+
+@skipUnless(settings.JINJA2_INSTALLED, 'requiere jinja2')
+class StorefrontEngineParityTests(ShardedTestCase):
+    """Las plantillas gemelas de templates/ y jinja2/ muestran lo mismo."""
+
+    TEMPLATES = ['products/index.html', 'products/show.html', 'products/_comments.html']
+
+    def setUp(self):
+        super().setUp()
+        # 23:30 del 31/12 en Santiago: el día cambia con la zona horaria
+        created_at = datetime(2024, 1, 1, 2, 30, tzinfo=dt_timezone.utc)
+        product = self.make_product(
+            pk=ON_SHARD_1, name='Teclado <mecánico>', description='Interruptores táctiles ' * 10,
+            created_at=created_at,
+        )
+        self.make_product(pk=ON_SHARD_0, name='Sin descripción', description='', created_at=created_at)
+        self.make_product(pk=ON_SHARD_0 + 1, created_at=created_at - timedelta(days=1))
+        for i in range(3):
+            comment = Comment.objects.create(product=product, description=f'Comentario {i} & más')
+            Comment.objects.for_product(product.pk).filter(pk=comment.pk).update(
+                created_at=created_at - timedelta(hours=i),
+            )
+        product = Product.objects.for_id(product.pk).get(pk=product.pk)
+
+        products, next_cursor = Product.objects.across_shards(limit=2)
+        comments, comments_cursor = Comment.objects.page_for_product(product.pk, 2)
+        self.context = {
+            'title': product.name,
+            'header_title': 'Detalles',
+            'products': products,
+            'next_cursor': next_cursor,
+            'product': product,
+            'product_id': product.pk,
+            'comments': comments,
+            'comments_cursor': comments_cursor,
+            'related_products': products[1:],
+        }
+        self.request = RequestFactory().get(reverse('products:show', args=[product.pk]))
+
+    def facts(self, html):
+        html = ' '.join(html.split())
+        return {
+            'links': re.findall(r'href="([^"]*)"', html),
+            'dates': re.findall(r'<(?:span class="badge|small)[^>]*> (.*?) </', html),
+            'descriptions': re.findall(r'<p class="card-text[^"]*"> (.*?) </p>', html),
+            'more': re.findall(r'href="([^"]*\?cursor=[^"]*)"', html),
+            'title': re.findall(r'<h[25][^>]*>(.*?)</h[25]>', html),
+        }
+
+    def test_both_engines_render_the_same_page(self):
+        with timezone.override('America/Santiago'):
+            for template_name in self.TEMPLATES:
+                with self.subTest(template=template_name):
+                    django_facts, jinja2_facts = [
+                        self.facts(engines[engine].get_template(template_name).render(self.context, self.request))
+                        for engine in ('django', 'jinja2')
+                    ]
+                    self.assertTrue(django_facts['dates'])
+                    self.assertEqual(len(django_facts['more']), 1)
+                    self.assertEqual(jinja2_facts, django_facts)
+
+    def test_index_truncates_and_escapes_like_django(self):
+        with timezone.override('America/Santiago'):
+            html = engines['jinja2'].get_template('products/index.html').render(self.context, self.request)
+        facts = self.facts(html)
+
+        # Mismo created_at: primero el id más alto (ON_SHARD_1)
+        self.assertEqual(len(facts['descriptions'][0]), 90)
+        self.assertTrue(facts['descriptions'][0].endswith('…'))
+        self.assertEqual(facts['descriptions'][1], 'Sin descripción.')
+        self.assertIn('Teclado &lt;mecánico&gt;', html)
+        self.assertEqual(facts['dates'], ['Dec 31, 2023', 'Dec 31, 2023'])
+
+
+@two_shards
+class ShardedStorefrontEngineParityTests(StorefrontEngineParityTests):
+    pass
+
+
+class CommentCountTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(pk=ON_SHARD_0)
+        self.other = self.make_product(pk=ON_SHARD_0 + 1)
+        self.alias = self.product._state.db
+
+    def count(self, product):
+        return Product.objects.for_id(product.pk).get(pk=product.pk).comment_count
+
+    def add_comments(self, product, n):
+        return [Comment.objects.create(product=product, description=f'Comentario {i}') for i in range(n)]
+
+    def counter_updates(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and 'comment_count' in q['sql']]
+
+    def test_save_and_instance_delete(self):
+        first, _ = self.add_comments(self.product, 2)
+        self.assertEqual(self.count(self.product), 2)
+
+        first.delete()
+        self.assertEqual(self.count(self.product), 1)
+
+    def test_saving_a_stale_product_keeps_the_counter(self):
+        stale = Product.objects.for_id(self.product.pk).get(pk=self.product.pk)
+        self.add_comments(self.product, 2)
+
+        stale.price = 20
+        stale.save()
+
+        fresh = Product.objects.for_id(self.product.pk).get(pk=self.product.pk)
+        self.assertEqual((fresh.price, fresh.comment_count), (20, 2))
+
+    def test_moving_a_comment_with_save_adjusts_both_products(self):
+        self.add_comments(self.product, 2)
+        comment = Comment.objects.for_product(self.product.pk).first()
+
+        comment.product = self.other
+        comment.save()
+        comment.description = 'Editado'
+        comment.save()
+
+        self.assertEqual(self.count(self.product), 1)
+        self.assertEqual(self.count(self.other), 1)
+
+    def test_bulk_create_adds_per_product(self):
+        Comment.objects.bulk_create(
+            [Comment(product=self.product, description='a') for _ in range(3)]
+            + [Comment(product=self.other, description='b')]
+        )
+
+        self.assertEqual(self.count(self.product), 3)
+        self.assertEqual(self.count(self.other), 1)
+
+    def test_queryset_delete_is_one_update_per_product(self):
+        self.add_comments(self.product, 3)
+        self.add_comments(self.other, 2)
+
+        with CaptureQueriesContext(connections[self.alias]) as queries:
+            Comment.objects.using(self.alias).filter(product__in=[self.product, self.other]).delete()
+
+        self.assertEqual(len(self.counter_updates(queries)), 2)
+        self.assertEqual(self.count(self.product), 0)
+        self.assertEqual(self.count(self.other), 0)
+
+    def test_cascade_from_product_skips_the_counter(self):
+        self.add_comments(self.product, 3)
+
+        with CaptureQueriesContext(connections[self.alias]) as queries:
+            self.product.delete()
+
+        self.assertEqual(self.counter_updates(queries), [])
+        self.assertFalse(Comment.objects.for_product(self.product.pk).exists())
+
+    def test_update_moving_comments_adjusts_both_products(self):
+        self.add_comments(self.product, 3)
+
+        moved = Comment.objects.using(self.alias).filter(product=self.product).order_by('pk').values_list('pk', flat=True)[:2]
+        Comment.objects.using(self.alias).filter(pk__in=list(moved)).update(product=self.other)
+
+        self.assertEqual(self.count(self.product), 1)
+        self.assertEqual(self.count(self.other), 2)
+
+    def test_recount_command_fixes_drift(self):
+        self.add_comments(self.product, 2)
+        Product._base_manager.using(self.alias).filter(pk=self.product.pk).update(comment_count=7)
+
+        out = StringIO()
+        call_command('recount_comments', '--dry-run', stdout=out)
+        self.assertIn('1 desviados', out.getvalue())
+        self.assertEqual(self.count(self.product), 7)
+
+        call_command('recount_comments', stdout=StringIO())
+        self.assertEqual(self.count(self.product), 2)
+
+
+@two_shards
+class ShardedCommentCountTests(CommentCountTests):
+    pass
+
+
+class StorefrontSmokeTests(ShardedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(pk=ON_SHARD_1, name='Teclado mecánico')
+        Comment.objects.create(product=self.product, description='Muy bueno')
+
+    def test_pages_render(self):
+        for url in [
+            reverse('products:index'),
+            reverse('products:list'),
+            reverse('products:create'),
+            reverse('products:show', args=[self.product.pk]),
+            reverse('products:comments', args=[self.product.pk]),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_admin_pages_render(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secreto')
+        self.client.force_login(admin)
+        comment = Comment.objects.for_product(self.product.pk).get()
+        # Con sharding el listado muestra un shard: el del producto
+        shard = {'shard': sharding.alias_for(self.product.pk)} if sharding.is_enabled() else {}
+
+        for url, params, text in [
+            (reverse('admin:products_product_changelist'), shard, 'Teclado'),
+            (reverse('admin:products_product_change', args=[self.product.pk]), {}, 'Teclado'),
+            (reverse('admin:products_comment_changelist'), shard, 'Comentario en &quot;Teclado'),
+            (reverse('admin:products_comment_change', args=[comment.pk]), {}, 'Muy bueno'),
+        ]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url, params), text)
+
+
+    def test_admin_writes(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secreto')
+        self.client.force_login(admin)
+        change = reverse('admin:products_product_change', args=[self.product.pk])
+        delete = reverse('admin:products_product_delete', args=[self.product.pk])
+
+        response = self.client.post(change, {'name': 'Teclado 60%', 'price': 80, 'description': ''})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.for_id(self.product.pk).get(pk=self.product.pk).price, 80)
+
+        response = self.client.post(reverse('admin:products_product_add'), {'name': 'Monitor', 'price': 300})
+        self.assertEqual(response.status_code, 302)
+        created, _ = Product.objects.across_shards(queryset=Product.objects.filter(name='Monitor'))
+        self.assertEqual(len(created), 1)
+
+        response = self.client.post(reverse('admin:products_comment_add'), {
+            'product': created[0].pk, 'description': 'Nítido',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Comment.objects.for_product(created[0].pk).count(), 1)
+
+        # La confirmación lista los comentarios que caen en cascada
+        self.assertContains(self.client.get(delete), 'Comentario en &quot;Teclado 60%')
+        self.assertEqual(self.client.post(delete, {'post': 'yes'}).status_code, 302)
+        self.assertFalse(Product.objects.for_id(self.product.pk).filter(pk=self.product.pk).exists())
+        self.assertEqual(self.client.post(delete, {'post': 'yes'}).status_code, 302)
+
+
+@two_shards
+class ShardedStorefrontSmokeTests(StorefrontSmokeTests):
+
+    def test_admin_rejects_moving_a_comment_to_another_shard(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secreto')
+        self.client.force_login(admin)
+        comment = Comment.objects.for_product(self.product.pk).get()
+        same_shard = self.make_product(pk=ON_SHARD_1 + 1, name='Ratón')
+        other_shard = self.make_product(pk=ON_SHARD_0, name='Monitor')
+        url = reverse('admin:products_comment_change', args=[comment.pk])
+
+        response = self.client.post(url, {'product': other_shard.pk, 'description': 'Muy bueno'})
+        self.assertContains(response, 'un comentario no puede cambiar de shard')
+        self.assertEqual(Comment.objects.for_product(self.product.pk).get().pk, comment.pk)
+
+        response = self.client.post(url, {'product': same_shard.pk, 'description': 'Muy bueno'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Comment.objects.for_product(same_shard.pk).filter(pk=comment.pk).exists())
+        counts = dict(Product.objects.using(SHARD_1).values_list('pk', 'comment_count'))
+        self.assertEqual((counts[self.product.pk], counts[same_shard.pk]), (0, 1))
+
+    def test_admin_lists_one_shard_at_a_time(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secreto')
+        self.client.force_login(admin)
+        url = reverse('admin:products_product_changelist')
+
+        self.assertNotContains(self.client.get(url, {'shard': SHARD_0}), 'Teclado')
+        self.assertContains(self.client.get(url, {'shard': SHARD_1}), 'Teclado')
+
+
+class CommentPageTests(ShardedTestCase):
+
+    TOTAL = COMMENTS_PAGE_SIZE + 5
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(pk=ON_SHARD_1, name='Teclado mecánico')
+        comments = Comment.objects.bulk_create([
+            Comment(product=self.product, description=f'comentario-{i:03d}') for i in range(self.TOTAL)
+        ])
+        # Un empate de created_at que cruza el límite entre la primera y la segunda página
+        now = timezone.now()
+        alias = self.product._state.db
+        tie = range(COMMENTS_PAGE_SIZE - 2, COMMENTS_PAGE_SIZE + 3)
+        for i, comment in enumerate(comments):
+            minutes = tie.start if i in tie else i
+            Comment._base_manager.using(alias).filter(pk=comment.pk).update(created_at=now - timedelta(minutes=minutes))
+        rows = Comment._base_manager.using(alias).values_list('description', 'created_at', 'pk')
+        self.expected = [d for d, _, _ in sorted(rows, key=lambda row: (row[1], row[2]), reverse=True)]
+
+    def descriptions(self, response):
+        return re.findall(r'comentario-\d{3}', response.content.decode())
+
+    def more_link(self, response):
+        match = re.search(r'href="([^"]+\?cursor=[^"]+)"', response.content.decode())
+        return match and match.group(1)
+
+    def test_show_renders_one_page_and_the_more_link(self):
+        response = self.client.get(reverse('products:show', args=[self.product.pk]))
+
+        self.assertEqual(self.descriptions(response), self.expected[:COMMENTS_PAGE_SIZE])
+        self.assertContains(response, 'Ver comentarios anteriores')
+        self.assertTrue(self.more_link(response).startswith(reverse('products:comments', args=[self.product.pk])))
+
+    def test_fragment_cursor_reaches_the_end_without_gaps(self):
+        response = self.client.get(reverse('products:show', args=[self.product.pk]))
+        seen, link = self.descriptions(response), self.more_link(response)
+        while link:
+            response = self.client.get(link.replace('&amp;', '&'))
+            seen += self.descriptions(response)
+            link = self.more_link(response)
+
+        self.assertEqual(seen, self.expected)
+        self.assertNotContains(response, 'Ver comentarios anteriores')
+
+    def test_invalid_cursor_falls_back_to_the_first_page(self):
+        url = reverse('products:comments', args=[self.product.pk])
+
+        response = self.client.get(url, {'cursor': 'no-es-un-cursor'})
+
+        self.assertEqual(self.descriptions(response), self.expected[:COMMENTS_PAGE_SIZE])
+
+    def test_header_count_needs_no_count_query(self):
+        with CaptureQueriesContext(connections[self.product._state.db]) as queries:
+            response = self.client.get(reverse('products:show', args=[self.product.pk]))
+
+        self.assertContains(response, f'Comentarios ({self.TOTAL})')
+        self.assertFalse([q['sql'] for q in queries if 'COUNT(' in q['sql'].upper()])
+
+
+@two_shards
+class ShardedCommentPageTests(CommentPageTests):
+    pass
+
+
+class SingleDatabaseTests(ShardedTestCase):
+
+    @override_settings(PRODUCT_SHARDS=[])
+    def test_without_shards_everything_uses_default(self):
+        product = self.make_product()
+        comment = Comment.objects.create(product=product, description='Hola')
+
+        self.assertEqual(product._state.db, 'default')
+        self.assertEqual(comment._state.db, 'default')
+        self.assertEqual(Product.objects.get(pk=product.pk), product)
@@ -7,7 +7,9 @@ MVC Role: ROUTER
   Routes:
     /products/              → ProductIndexView (list)
     /products/create/       → ProductCreateView (form)
+    /products/changes/      → ProductChangesView (feed CDC, JSON)
     /products/<id>/         → ProductShowView (detail)
+    /products/<id>/comments/ → ProductCommentsView (older comments, HTML fragment)
 
   Note: 'create/' is declared BEFORE '<id>/' so Django never
   tries to cast the string "create" as an integer id.
@@ -15,7 +17,10 @@ MVC Role: ROUTER
 """
 
 from django.urls import path
-from .views import ProductIndexView, ProductShowView, ProductCreateView, ProductListView
+from .views import (
+    ProductIndexView, ProductShowView, ProductCreateView, ProductListView, ProductChangesView,
+    ProductCommentsView,
+)
 
 app_name = 'products'  # URL namespace
 
@@ -29,6 +34,12 @@ urlpatterns = [
     # Bonus: /products/list/  ← usando el ListView genérico
     path('list/', ProductListView.as_view(), name='list'),
 
+    # /products/changes/?since=<token>  ← feed de cambios para consumidores
+    path('changes/', ProductChangesView.as_view(), name='changes'),
+
     # /products/<id>/  e.g. /products/3/
     path('<int:id>/', ProductShowView.as_view(), name='show'),
+
+    # /products/<id>/comments/?cursor=<c>  ← página anterior de comentarios (fragmento)
+    path('<int:id>/comments/', ProductCommentsView.as_view(), name='comments'),
 ]
@@ -7,30 +7,56 @@ MVC Role: CONTROLLER
   - Utilizamos Product.objects.all() en lugar de memoria estática.
   - Añadimos validación con get_object_or_404.
   - Demostramos el uso de ListView.
+  - Los listados hacen scatter-gather sobre todos los shards y
+    paginan con cursores keyset (?cursor=...), ver products/sharding.py.
+  - Las páginas más visitadas (index, list, show) se renderizan con
+    el motor de settings.STOREFRONT_TEMPLATE_ENGINE ('django' por
+    defecto, o 'jinja2'); sus plantillas gemelas están en jinja2/.
 ─────────────────────────────────────────────────────────────────
 """
 
+from django.conf import settings
+from django.http import JsonResponse
 from django.views.generic import TemplateView, View, ListView
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Product
+from . import changes, recommendations
+from .models import Comment, Product
 from .forms import ProductForm
 
+# Productos por página en los listados (paginación keyset)
+PRODUCTS_PAGE_SIZE = 24
+
+# Comentarios por página en el detalle (el resto se carga con "Ver anteriores")
+COMMENTS_PAGE_SIZE = 20
+
+# Productos "comprados juntos" en la página de detalle
+RELATED_PRODUCTS_LIMIT = 4
+
+# Máximo de eventos por petición al feed de cambios
+CHANGES_MAX_LIMIT = 1000
+
 
 # ── 1A.  Product Index Original (TemplateView + ORM manual) ──────
 
 class ProductIndexView(TemplateView):
     """
-    Lista todos los productos utilizando Product.objects.all().
+    Lista los productos de todos los shards, página a página.
     """
     template_name = 'products/index.html'
+    template_engine = settings.STOREFRONT_TEMPLATE_ENGINE
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Nuestros Productos'
         context['header_title'] = 'Products Catalog'
         
-        # OBTENER TODOS LOS REGISTROS DESDE SQL (SELECT * FROM products_product)
-        context['products'] = Product.objects.all()
+        # SELECT ... ORDER BY created_at DESC, id DESC LIMIT n  (en cada shard)
+        products, next_cursor = Product.objects.across_shards(
+            limit=PRODUCTS_PAGE_SIZE,
+            cursor=self.request.GET.get('cursor'),
+        )
+        context['products'] = products
+        context['next_cursor'] = next_cursor
         return context
 
 
@@ -44,9 +70,19 @@ class ProductListView(ListView):
     model = Product
     template_name = 'products/index.html'
     context_object_name = 'products' # Igual que arriba
+    template_engine = settings.STOREFRONT_TEMPLATE_ENGINE
+
+    def get_queryset(self):
+        # ListView acepta cualquier iterable: aquí la página ya mezclada
+        products, self.next_cursor = Product.objects.across_shards(
+            limit=PRODUCTS_PAGE_SIZE,
+            cursor=self.request.GET.get('cursor'),
+        )
+        return products
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
         context['title'] = 'Listado Generic ListView'
         context['header_title'] = 'Products Catalog ListView'
         return context
@@ -56,6 +92,7 @@ class ProductListView(ListView):
 
 class ProductShowView(TemplateView):
     template_name = 'products/show.html'
+    template_engine = settings.STOREFRONT_TEMPLATE_ENGINE
 
     def get(self, request, *args, **kwargs):
         product_id = kwargs.get('id')
@@ -63,16 +100,43 @@ class ProductShowView(TemplateView):
         # Buscar en BD o disparar except -> redireccionar
         try:
             # Busca 'id' exacto o falla
-            product = get_object_or_404(Product, id=product_id)
+            product = get_object_or_404(Product.objects.for_id(product_id), id=product_id)
         except Exception:
             # Feature: redirect to home if invalid
             return redirect('pages:home')
 
+        # Sólo la página más reciente; el total sale de product.comment_count
+        comments, comments_cursor = Comment.objects.page_for_product(product.id, COMMENTS_PAGE_SIZE)
+
         return render(request, self.template_name, {
             'title': product.name,
             'header_title': 'Detalles',
             'product': product,
-        })
+            'product_id': product.id,
+            'comments': comments,
+            'comments_cursor': comments_cursor,
+            # Top-k precalculado en ProductPair (una consulta indexada)
+            'related_products': recommendations.related_products(product.id, RELATED_PRODUCTS_LIMIT),
+        }, using=self.template_engine)
+
+
+class ProductCommentsView(View):
+    """
+    Fragmento HTML con la siguiente página de comentarios (?cursor=...).
+    Lo pide show.html al pulsar "Ver comentarios anteriores".
+    """
+    template_name = 'products/_comments.html'
+    template_engine = settings.STOREFRONT_TEMPLATE_ENGINE
+
+    def get(self, request, id):
+        comments, comments_cursor = Comment.objects.page_for_product(
+            id, COMMENTS_PAGE_SIZE, cursor=request.GET.get('cursor'),
+        )
+        return render(request, self.template_name, {
+            'product_id': id,
+            'comments': comments,
+            'comments_cursor': comments_cursor,
+        }, using=self.template_engine)
 
 
 # ── 3.   Product Create (ModelForm Save) ─────────────────────────
@@ -114,3 +178,39 @@ class ProductCreateView(View):
             'form': form,
             'success': False,
         })
+
+
+# ── 4.   Feed de cambios (CDC / outbox) ──────────────────────────
+
+class ProductChangesView(View):
+    """
+    FEED INCREMENTAL — GET /products/changes/?since=<token>&limit=500
+    Devuelve los eventos del outbox posteriores a `since` y el token
+    con el que pedir la siguiente página (ver products/changes.py).
+    Expone todos los cambios del catálogo: sólo para staff o con la
+    cabecera X-Changes-Token firmada (manage.py changes_token).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = request.META.get(changes.TOKEN_HEADER)
+        if token is not None:
+            allowed = changes.read_consumer_token(token) is not None
+        else:
+            allowed = request.user.is_active and request.user.is_staff
+        if not allowed:
+            return JsonResponse({'error': 'Se requiere staff o un X-Changes-Token válido'}, status=403)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', 500))
+        except ValueError:
+            limit = 500
+        limit = min(max(limit, 1), CHANGES_MAX_LIMIT)
+
+        events, next_token = changes.read_changes(request.GET.get('since'), limit=limit)
+        return JsonResponse({
+            'changes': [changes.as_dict(event) for event in events],
+            'next': next_token,
+            'has_more': len(events) == limit,
+        })
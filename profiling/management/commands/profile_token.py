@@ -0,0 +1,25 @@
+"""
+profiling/management/commands/profile_token.py
+==============================================
+Prints a signed token for the X-Profile header.
+
+  curl -H "X-Profile: $(python manage.py profile_token --mode trace)" \
+       http://localhost:8000/products/3/
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from profiling.middleware import make_token
+from profiling.profilers import PROFILERS
+
+
+class Command(BaseCommand):
+    help = 'Prints a signed X-Profile header value to profile one request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=sorted(PROFILERS), default='sample')
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token(options['mode']))
+        self.stderr.write(f'valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds')
@@ -0,0 +1,102 @@
+"""
+profiling/middleware.py
+=======================
+ON-DEMAND REQUEST PROFILING
+─────────────────────────────────────────────────────────────────
+A request is profiled only when it asks for it:
+
+  - Header  X-Profile: <signed token>   (python manage.py profile_token)
+  - Query   ?__profile=trace|sample     (staff users only)
+
+Every other request goes straight through: the check is two
+dictionary lookups and nothing is imported, wrapped or timed.
+With PROFILING_ENABLED = False the middleware removes itself.
+
+Must be placed AFTER AuthenticationMiddleware (uses request.user).
+─────────────────────────────────────────────────────────────────
+"""
+
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+HEADER = 'HTTP_X_PROFILE'
+PARAM = '__profile'
+SALT = 'profiling.token'
+
+
+def make_token(mode='sample'):
+    return signing.TimestampSigner(salt=SALT).sign(mode)
+
+
+def read_token(token):
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if HEADER not in request.META and PARAM not in request.META.get('QUERY_STRING', ''):
+            return self.get_response(request)
+
+        mode = self._requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        return self._profile(request, mode)
+
+    def _requested_mode(self, request):
+        from .profilers import PROFILERS
+
+        if HEADER in request.META:
+            mode = read_token(request.META[HEADER])
+        elif getattr(request, 'user', None) is not None and request.user.is_staff:
+            mode = request.GET.get(PARAM) or 'sample'
+        else:
+            mode = None
+        return mode if mode in PROFILERS else None
+
+    def _profile(self, request, mode):
+        from . import store
+        from .profilers import PROFILERS, SamplingProfiler, SqlTimeline
+
+        if mode == 'sample':
+            profiler = SamplingProfiler(interval=settings.PROFILING_SAMPLE_INTERVAL)
+        else:
+            profiler = PROFILERS[mode]()
+
+        started = time.perf_counter()
+        with SqlTimeline(started) as timeline:
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        elapsed = time.perf_counter() - started
+
+        profile_id = store.new_id()
+        store.save(profile_id, {
+            'id': profile_id,
+            'path': request.get_full_path(),
+            'method': request.method,
+            'mode': mode,
+            'unit': profiler.unit,
+            'status': response.status_code,
+            'total_ms': round(elapsed * 1000, 2),
+            'sql_count': len(timeline.queries),
+            'sql_ms': round(sum(q['duration_ms'] for q in timeline.queries), 2),
+            'created_at': timezone.now().isoformat(),
+        }, profiler.stacks, timeline.queries)
+
+        response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,161 @@
+"""
+profiling/profilers.py
+======================
+PROFILERS FOR A SINGLE REQUEST
+─────────────────────────────────────────────────────────────────
+Both profilers produce "collapsed stacks" — one line per distinct
+call stack, frames joined by ';' plus a weight — the input format of
+flamegraph.pl, speedscope and inferno:
+
+  TracingProfiler   deterministic; hooks every Python/C call with
+                    sys.setprofile. Exact, but slows the request down.
+                    Weight = self time in microseconds.
+  SamplingProfiler  low overhead; a background thread snapshots the
+                    request thread's stack every `interval` seconds.
+                    Weight = number of samples.
+
+SqlTimeline records every query on every database alias (shards too)
+with its offset from the start of the request and its duration.
+─────────────────────────────────────────────────────────────────
+"""
+
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+# Shortens paths: site-packages/, lib/python3.X/ and the project root
+_PATH_PREFIX = re.compile(
+    r'^(.*/site-packages/|.*/lib/python\d+\.\d+/|' + re.escape(str(settings.BASE_DIR).replace('\\', '/')) + '/)'
+)
+
+
+def frame_label(code):
+    """'get_context_data (products/views.py:31)' — no ';' allowed in folded output."""
+    filename = _PATH_PREFIX.sub('', code.co_filename.replace('\\', '/'))
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+def c_label(func):
+    module = getattr(func, '__module__', None) or 'builtins'
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', repr(func))
+    return f'{module}.{name} [C]'.replace(';', ',')
+
+
+# ── Deterministic ────────────────────────────────────────────────
+
+class TracingProfiler:
+    unit = 'us'
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._names = []
+        self._frames = []  # [start, child_time] for each open frame
+
+    def start(self):
+        sys.setprofile(self._callback)
+
+    def stop(self):
+        sys.setprofile(None)
+        now = time.perf_counter()
+        while self._frames:
+            self._pop(now)
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call':
+            self._push(frame_label(frame.f_code), now)
+        elif event == 'c_call':
+            self._push(c_label(arg), now)
+        elif self._frames and event in ('return', 'c_return', 'c_exception'):
+            self._pop(now)
+
+    def _push(self, name, now):
+        self._names.append(name)
+        self._frames.append([now, 0.0])
+
+    def _pop(self, now):
+        start, child_time = self._frames.pop()
+        elapsed = now - start
+        self.stacks[';'.join(self._names)] += int((elapsed - child_time) * 1_000_000)
+        self._names.pop()
+        if self._frames:
+            self._frames[-1][1] += elapsed
+
+
+# ── Sampling ─────────────────────────────────────────────────────
+
+class SamplingProfiler:
+    unit = 'samples'
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+
+PROFILERS = {
+    'trace': TracingProfiler,
+    'sample': SamplingProfiler,
+}
+
+
+# ── SQL ──────────────────────────────────────────────────────────
+
+class SqlTimeline:
+    """Records queries from every configured connection while active."""
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self._wrapper(alias)))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+    def _wrapper(self, alias):
+        def record(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append({
+                    'alias': alias,
+                    'offset_ms': round((start - self.started) * 1000, 3),
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+                    'many': many,
+                    'sql': sql,
+                })
+        return record
@@ -0,0 +1,72 @@
+"""
+profiling/store.py
+==================
+PROFILE FILES ON DISK
+─────────────────────────────────────────────────────────────────
+Each profiled request writes three files to settings.PROFILING_DIR:
+
+  <id>.folded     collapsed stacks (flamegraph.pl / speedscope input)
+  <id>.sql.json   SQL timeline
+  <id>.json       metadata (path, mode, status, total time...)
+
+Only the newest settings.PROFILING_KEEP profiles are kept.
+─────────────────────────────────────────────────────────────────
+"""
+
+import json
+import re
+import secrets
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+
+def profile_dir():
+    path = Path(settings.PROFILING_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save(profile_id, meta, stacks, queries):
+    path = profile_dir()
+    folded = '\n'.join(f'{stack} {weight}' for stack, weight in stacks.most_common() if weight > 0)
+    (path / f'{profile_id}.folded').write_text(folded + '\n')
+    (path / f'{profile_id}.sql.json').write_text(json.dumps(queries, indent=1))
+    (path / f'{profile_id}.json').write_text(json.dumps(meta, indent=1))
+    prune(path)
+
+
+def prune(path):
+    metas = sorted(path.glob('*[0-9a-f].json'), reverse=True)
+    for old in metas[settings.PROFILING_KEEP:]:
+        profile_id = old.name[:-len('.json')]
+        for suffix in ('.json', '.folded', '.sql.json'):
+            (path / f'{profile_id}{suffix}').unlink(missing_ok=True)
+
+
+def recent(limit=50):
+    path = profile_dir()
+    metas = sorted(path.glob('*[0-9a-f].json'), reverse=True)[:limit]
+    return [json.loads(meta.read_text()) for meta in metas]
+
+
+def load(profile_id):
+    """Returns (meta, folded_text, queries) or None for unknown/invalid ids."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = profile_dir()
+    meta_file = path / f'{profile_id}.json'
+    if not meta_file.exists():
+        return None
+    return (
+        json.loads(meta_file.read_text()),
+        (path / f'{profile_id}.folded').read_text(),
+        json.loads((path / f'{profile_id}.sql.json').read_text()),
+    )
+
+
+def new_id():
+    return f'{timezone.now():%Y%m%dT%H%M%S}-{secrets.token_hex(4)}'
@@ -0,0 +1,166 @@
+"""
+profiling/tests.py
+==================
+TESTS FOR THE PROFILING APP
+─────────────────────────────────────────────────────────────────
+Each test writes its profiles to a temporary PROFILING_DIR.
+─────────────────────────────────────────────────────────────────
+"""
+
+import json
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import store
+from .middleware import make_token
+
+PROFILED_URL = '/about/'
+
+
+class ProfilingTestCase(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        override = override_settings(PROFILING_DIR=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def login(self, is_staff):
+        user = User.objects.create_user('staff' if is_staff else 'customer', password='secreto', is_staff=is_staff)
+        self.client.force_login(user)
+
+    def saved_files(self):
+        return sorted(path.name for path in self.dir.iterdir())
+
+    def assertNotProfiled(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.saved_files(), [])
+
+
+class MiddlewareTests(ProfilingTestCase):
+
+    def test_plain_request_is_not_profiled(self):
+        self.assertNotProfiled(self.client.get(PROFILED_URL))
+
+    def test_query_param_is_ignored_for_anonymous_and_non_staff(self):
+        self.assertNotProfiled(self.client.get(PROFILED_URL, {'__profile': 'trace'}))
+        self.login(is_staff=False)
+        self.assertNotProfiled(self.client.get(PROFILED_URL, {'__profile': 'trace'}))
+
+    def test_staff_query_param_writes_the_three_files(self):
+        self.login(is_staff=True)
+        for mode in ('trace', 'sample'):
+            with self.subTest(mode=mode):
+                response = self.client.get(PROFILED_URL, {'__profile': mode})
+
+                profile_id = response['X-Profile-Id']
+                self.assertRegex(profile_id, store.PROFILE_ID)
+                for suffix in ('.folded', '.json', '.sql.json'):
+                    self.assertTrue((self.dir / f'{profile_id}{suffix}').exists(), suffix)
+                meta = json.loads((self.dir / f'{profile_id}.json').read_text())
+                self.assertEqual(meta['mode'], mode)
+                self.assertEqual(meta['status'], 200)
+                self.assertEqual(meta['path'], f'{PROFILED_URL}?__profile={mode}')
+
+    def test_unknown_mode_is_ignored(self):
+        self.login(is_staff=True)
+        self.assertNotProfiled(self.client.get(PROFILED_URL, {'__profile': 'bogus'}))
+
+    def test_signed_header_is_accepted_without_login(self):
+        response = self.client.get(PROFILED_URL, HTTP_X_PROFILE=make_token('trace'))
+
+        meta = json.loads((self.dir / f'{response["X-Profile-Id"]}.json').read_text())
+        self.assertEqual(meta['mode'], 'trace')
+
+    def test_bad_or_expired_header_is_ignored(self):
+        token = make_token('trace')
+        expired_at = time.time() - settings.PROFILING_TOKEN_MAX_AGE - 60
+        with mock.patch('django.core.signing.time.time', return_value=expired_at):
+            expired = make_token('trace')
+
+        for header in (token + 'x', 'trace', expired):
+            with self.subTest(header=header):
+                self.assertNotProfiled(self.client.get(PROFILED_URL, HTTP_X_PROFILE=header))
+
+    def test_header_is_not_replaced_by_the_query_param(self):
+        # Staff with an invalid token: the header wins and nothing is profiled
+        self.login(is_staff=True)
+        self.assertNotProfiled(self.client.get(PROFILED_URL, {'__profile': 'trace'}, HTTP_X_PROFILE='bad'))
+
+
+class StoreTests(ProfilingTestCase):
+
+    def save(self, profile_id):
+        store.save(profile_id, {'id': profile_id}, Counter({'main (app.py:1)': 3}), [])
+
+    @override_settings(PROFILING_KEEP=2)
+    def test_prune_keeps_the_newest_profiles(self):
+        ids = [f'20240101T00000{second}-0000abcd' for second in range(4)]
+        for profile_id in ids:
+            self.save(profile_id)
+
+        self.assertEqual(
+            self.saved_files(),
+            sorted(f'{profile_id}{suffix}' for profile_id in ids[-2:] for suffix in ('.folded', '.json', '.sql.json')),
+        )
+        self.assertEqual([meta['id'] for meta in store.recent()], ids[:-3:-1])
+
+    def test_load_round_trips(self):
+        self.save('20240101T000000-0000abcd')
+
+        meta, folded, queries = store.load('20240101T000000-0000abcd')
+
+        self.assertEqual(meta, {'id': '20240101T000000-0000abcd'})
+        self.assertEqual(folded, 'main (app.py:1) 3\n')
+        self.assertEqual(queries, [])
+
+    def test_load_rejects_ids_outside_profile_id(self):
+        (self.dir / 'notes.json').write_text('{}')
+        for profile_id in ('notes', '../settings', '20240101T000000-0000ABCD', '20240101T000000-0000abcd.sql'):
+            with self.subTest(profile_id=profile_id):
+                self.assertIsNone(store.load(profile_id))
+
+
+class ViewTests(ProfilingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile_id = '20240101T000000-0000abcd'
+        store.save(self.profile_id, {
+            'id': self.profile_id, 'path': '/about/', 'method': 'GET', 'mode': 'trace', 'unit': 'us',
+            'status': 200, 'total_ms': 1.5, 'sql_count': 0, 'sql_ms': 0, 'created_at': '2024-01-01T00:00:00',
+        }, Counter({'get (pages/views.py:1);render (django/shortcuts.py:1)': 7}), [])
+        self.urls = [
+            reverse('profiling:index'),
+            reverse('profiling:show', args=[self.profile_id]),
+            reverse('profiling:folded', args=[self.profile_id]),
+        ]
+
+    def test_views_require_staff(self):
+        for url in self.urls:
+            with self.subTest(url=url, user='anonymous'):
+                self.assertRedirects(self.client.get(url), f'{reverse("admin:login")}?next={url}')
+        self.login(is_staff=False)
+        for url in self.urls:
+            with self.subTest(url=url, user='customer'):
+                self.assertRedirects(self.client.get(url), f'{reverse("admin:login")}?next={url}')
+
+    def test_staff_sees_the_profile(self):
+        self.login(is_staff=True)
+
+        self.assertContains(self.client.get(self.urls[0]), self.profile_id)
+        self.assertContains(self.client.get(self.urls[1]), 'render (django/shortcuts.py:1)')
+        folded = self.client.get(self.urls[2])
+        self.assertEqual(folded.content.decode(), 'get (pages/views.py:1);render (django/shortcuts.py:1) 7\n')
+        self.assertEqual(self.client.get(reverse('profiling:show', args=['notes'])).status_code, 404)
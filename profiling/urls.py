@@ -0,0 +1,23 @@
+"""
+profiling/urls.py
+=================
+URL PATTERNS FOR THE PROFILING APP
+─────────────────────────────────────────────────────────────────
+MVC Role: ROUTER
+  Routes:
+    /profiling/                 → ProfileIndexView
+    /profiling/<id>/            → ProfileShowView
+    /profiling/<id>/folded/     → ProfileFoldedView (download)
+─────────────────────────────────────────────────────────────────
+"""
+
+from django.urls import path
+from .views import ProfileIndexView, ProfileShowView, ProfileFoldedView
+
+app_name = 'profiling'  # URL namespace
+
+urlpatterns = [
+    path('', ProfileIndexView.as_view(), name='index'),
+    path('<str:profile_id>/', ProfileShowView.as_view(), name='show'),
+    path('<str:profile_id>/folded/', ProfileFoldedView.as_view(), name='folded'),
+]
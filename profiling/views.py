@@ -0,0 +1,79 @@
+"""
+profiling/views.py
+==================
+VIEWS FOR THE PROFILING APP
+─────────────────────────────────────────────────────────────────
+Staff-only pages to browse the profiles saved by ProfilingMiddleware:
+
+  /profiling/                  → recent profiles
+  /profiling/<id>/             → hottest functions + SQL timeline
+  /profiling/<id>/folded/      → raw collapsed stacks (for flamegraph.pl)
+─────────────────────────────────────────────────────────────────
+"""
+
+from collections import Counter
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.generic import TemplateView, View
+
+from . import store
+
+# Functions shown on the detail page
+TOP_FUNCTIONS = 40
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileIndexView(TemplateView):
+    template_name = 'profiling/index.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = 'Profiles'
+        context['header_title'] = 'Request Profiles'
+        context['profiles'] = store.recent()
+        return context
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileShowView(TemplateView):
+    template_name = 'profiling/show.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        loaded = store.load(kwargs['profile_id'])
+        if loaded is None:
+            raise Http404('Profile not found')
+        meta, folded, queries = loaded
+
+        # Self weight per function (leaf of each stack)
+        leaves = Counter()
+        for line in folded.splitlines():
+            stack, _, weight = line.rpartition(' ')
+            if not stack:
+                continue
+            leaves[stack.rsplit(';', 1)[-1]] += int(weight)
+
+        total = sum(leaves.values()) or 1
+        context['title'] = f'Profile {meta["id"]}'
+        context['header_title'] = meta['path']
+        context['meta'] = meta
+        context['functions'] = [
+            {'name': name, 'weight': weight, 'percent': round(weight * 100 / total, 1)}
+            for name, weight in leaves.most_common(TOP_FUNCTIONS)
+        ]
+        context['queries'] = queries
+        return context
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileFoldedView(View):
+
+    def get(self, request, profile_id):
+        loaded = store.load(profile_id)
+        if loaded is None:
+            raise Http404('Profile not found')
+        response = HttpResponse(loaded[1], content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+        return response